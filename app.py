@@ -12,17 +12,19 @@ import threading
 import logging
 import os
 import sys
-import json
 import time
+import random
 import signal
 import importlib.util
-import subprocess
 import base64
 import ipaddress
-from datetime import datetime
+from datetime import datetime, timezone
 from flask import Flask, request, jsonify, render_template_string, abort
 from concurrent.futures import ThreadPoolExecutor
-from functools import wraps
+from functools import wraps, lru_cache
+from modules.logsetup import setup_logging, stop_logging
+from modules.eventloop import install_event_loop_policy
+from modules.streams import take_buffered
 
 # 添加当前目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -37,7 +39,46 @@ current_proxy = None
 socks_server = None
 country_monitor = None
 main_loop = None  # 主事件循环
+getip_module = None  # 已加载的 getip 模块（复用其中的持久 HTTP 客户端）
 executor = ThreadPoolExecutor(max_workers=4)  # 线程池
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # 支持 sendmsg 时批量写出走 writelines
+
+# 预编译的 SOCKS5 报文打包函数
+_PACK_B = struct.Struct('B').pack
+_PORT_STRUCT = struct.Struct('>H')
+
+@lru_cache(maxsize=1024)
+def build_socks5_connect_request(target_host, target_port):
+    """构造 SOCKS5 CONNECT 请求报文（按目标缓存，常用目标无需重复组装）"""
+    try:
+        addr_data = b'\x01' + socket.inet_pton(socket.AF_INET, target_host)
+    except OSError:
+        try:
+            addr_data = b'\x04' + socket.inet_pton(socket.AF_INET6, target_host)
+        except OSError:
+            target_host_bytes = target_host.encode('utf-8')
+            addr_data = b'\x03' + _PACK_B(len(target_host_bytes)) + target_host_bytes
+    
+    # 在预分配的缓冲区中组装请求：头部 + 地址 + 端口
+    addr_end = 3 + len(addr_data)
+    request_data = bytearray(addr_end + 2)
+    request_data[0:3] = b'\x05\x01\x00'
+    request_data[3:addr_end] = addr_data
+    _PORT_STRUCT.pack_into(request_data, addr_end, target_port)
+    return bytes(request_data)
+
+def tune_tcp_socket(writer):
+    """关闭 Nagle 并在 Linux 上启用 TCP_QUICKACK，降低握手阶段小包延迟"""
+    sock = writer.get_extra_info('socket')
+    if sock is None:
+        return
+    
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    except OSError as e:
+        logging.debug(f"🔧 设置TCP选项失败: {e}")
 
 proxy_stats = {
     'current_proxy': None,
@@ -192,8 +233,13 @@ def require_web_access():
         return decorated_function
     return decorator
 
-def safe_import_getip():
-    """安全导入 getip 模块"""
+def safe_import_getip(func_name='newip'):
+    """安全导入 getip 模块，返回其中的 func_name 函数（模块只加载一次）"""
+    global getip_module
+    
+    if getip_module is not None:
+        return getattr(getip_module, func_name, None)
+    
     try:
         getip_path = os.path.join(current_dir, 'modules', 'getip.py')
         if not os.path.exists(getip_path):
@@ -210,11 +256,12 @@ def safe_import_getip():
         
         # 动态导入 getip
         spec = importlib.util.spec_from_file_location("getip", getip_path)
-        getip_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(getip_module)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        getip_module = module
         
         logging.info("✅ getip 模块加载成功")
-        return getip_module.newip
+        return getattr(getip_module, func_name, None)
         
     except Exception as e:
         logging.error(f"❌ getip 模块加载失败: {e}")
@@ -241,13 +288,20 @@ class CountryMonitor:
         self.check_interval = check_interval
         self.is_monitoring = False
         self.last_check_time = 0
+        self.last_check_time_iso = None  # 写入时预先格式化，避免每次查询状态都构造datetime
         self.last_country = None
         self.consecutive_failures = 0
         self.max_failures = 3
+        self.loop_errors = 0  # 监控循环连续异常次数，用于退避
         self.monitor_task = None
         
-        # 黑名单功能支持
+        # 事件驱动检测：上游连接连续失败达到阈值时立即唤醒监控循环
         self.config = config or {}
+        self.probe_failure_threshold = int(self.config.get('probe_failure_threshold', '3'))
+        self.upstream_failures = 0
+        self._probe_event = asyncio.Event()
+        
+        # 黑名单功能支持
         self.enable_blacklist = self.config.get('enable_ip_blacklist', 'True').lower() == 'true'
         self.blacklist_url = self.config.get('ip_blacklist_url', '')
         
@@ -320,12 +374,38 @@ class CountryMonitor:
                 # 原有的代理国家检查
                 await self.check_and_switch_if_needed()
                 
-                await asyncio.sleep(self.check_interval)
+                # 等待下次检测：定时（带抖动）或上游连接失败事件提前唤醒
+                self.loop_errors = 0
+                await self._wait_for_probe(self.check_interval * random.uniform(0.8, 1.2))
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logging.error(f"❌ 监控循环异常: {e}")
-                await asyncio.sleep(10)
+                # 连续异常时指数退避（上限300秒）并加入抖动
+                self.loop_errors += 1
+                delay = min(300, 10 * 2 ** (self.loop_errors - 1)) * random.uniform(0.5, 1.5)
+                logging.error(f"❌ 监控循环异常: {e}，{delay:.0f} 秒后重试")
+                await asyncio.sleep(delay)
+    
+    async def _wait_for_probe(self, timeout):
+        """等待检测时机：超时或收到上游失败事件"""
+        try:
+            await asyncio.wait_for(self._probe_event.wait(), timeout=timeout)
+            logging.info("⚡ 上游连接连续失败，提前触发代理国家检测")
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._probe_event.clear()
+    
+    def report_upstream_failure(self):
+        """记录一次上游连接失败，达到阈值时唤醒监控循环"""
+        self.upstream_failures += 1
+        if self.upstream_failures >= self.probe_failure_threshold:
+            self.upstream_failures = 0
+            self._probe_event.set()
+    
+    def report_upstream_success(self):
+        """上游连接成功，重置失败计数"""
+        self.upstream_failures = 0
     
     def stop_monitoring(self):
         """停止监控"""
@@ -352,6 +432,7 @@ class CountryMonitor:
                 proxy_stats['current_country'] = country
                 proxy_stats['total_checks'] += 1
                 self.last_check_time = time.time()
+                self.last_check_time_iso = datetime.fromtimestamp(self.last_check_time, timezone.utc).isoformat()
                 
                 if self.last_country != country:
                     if self.last_country is not None:
@@ -389,48 +470,34 @@ class CountryMonitor:
     async def detect_proxy_country(self, proxy_url):
         """检测代理的真实出口国家（集成黑名单检查）"""
         try:
-            proxy_for_curl = proxy_url
-            if proxy_for_curl.startswith('socks5://'):
-                proxy_for_curl = proxy_for_curl[9:]
-            
-            cmd = [
-                'curl', '-s', '--connect-timeout', '10', '--max-time', '15',
-                '-x', f'socks5://{proxy_for_curl}',
-                'https://ipinfo.io?token=68cdce81ca2b21'
-            ]
+            from modules.country_proxy_manager import fetch_ipinfo
             
-            # 在线程池中运行subprocess
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                executor, 
-                lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=20)
-            )
+            if '://' not in proxy_url:
+                proxy_url = f'socks5://{proxy_url}'
             
-            if result.returncode == 0:
-                try:
-                    data = json.loads(result.stdout)
-                    country = data.get('country')
-                    ip = data.get('ip')
-                    
-                    if country and ip:
-                        # 检查IP是否在黑名单中（如果黑名单管理器可用）
-                        if self.proxy_manager and self.proxy_manager.is_ip_blacklisted(ip):
-                            logging.warning(f"🚫 落地IP {ip} 在黑名单中，国家: {country}")
-                            proxy_stats['blacklist_hits'] += 1
-                            return 'BLACKLISTED'
-                        
-                        logging.debug(f"🌐 检测到代理信息: IP={ip}, 国家={country}")
-                        return country
-                    else:
-                        logging.warning("⚠️ IP检测响应缺少必要字段")
-                        return None
-                        
-                except json.JSONDecodeError:
-                    logging.error("❌ IP检测服务返回无效JSON")
-                    return None
+            # 直接经 SOCKS5 请求 ipinfo.io，不再派生 curl 子进程；有黑名单管理器时复用其代理会话
+            if self.proxy_manager:
+                data = await self.proxy_manager.query_ipinfo(proxy_url)
+            else:
+                data = await fetch_ipinfo(proxy_url)
+            
+            if data is None:
+                return None
+            
+            country = data.get('country')
+            ip = data.get('ip')
+            
+            if country and ip:
+                # 检查IP是否在黑名单中（如果黑名单管理器可用）
+                if self.proxy_manager and self.proxy_manager.is_ip_blacklisted(ip):
+                    logging.warning(f"🚫 落地IP {ip} 在黑名单中，国家: {country}")
+                    proxy_stats['blacklist_hits'] += 1
+                    return 'BLACKLISTED'
+                
+                logging.debug(f"🌐 检测到代理信息: IP={ip}, 国家={country}")
+                return country
             else:
-                error_msg = result.stderr.strip() if result.stderr else "未知错误"
-                logging.error(f"❌ curl 检测失败: {error_msg}")
+                logging.warning("⚠️ IP检测响应缺少必要字段")
                 return None
                 
         except Exception as e:
@@ -444,51 +511,40 @@ class CountryMonitor:
         logging.info(f"🔄 开始切换代理，原因: {reason}")
         
         try:
-            newip_func = safe_import_getip()
+            # 直接使用异步的 newip_async，候选代理获取不占用线程池、不阻塞事件循环
+            newip_func = safe_import_getip('newip_async')
             if not newip_func:
                 logging.error("❌ getip 模块不可用，无法切换代理")
                 return False
             
             max_attempts = 2
-            for attempt in range(max_attempts):
-                try:
-                    # 在线程池中获取新代理
-                    loop = asyncio.get_event_loop()
-                    new_proxy = await loop.run_in_executor(executor, newip_func)
-                    
-                    if new_proxy:
-                        logging.info(f"🧪 验证新代理国家 (尝试 {attempt + 1}/{max_attempts})")
-                        # 使用统一的检测方法
-                        country = await self.detect_proxy_country(new_proxy)
-                        
-                        if country == self.target_country:
-                            old_proxy = current_proxy
-                            current_proxy = new_proxy
-                            proxy_stats['current_proxy'] = new_proxy
-                            proxy_stats['current_country'] = country
-                            proxy_stats['proxy_switches'] += 1
-                            self.last_country = country
-                            
-                            logging.info(f"✅ 代理切换成功: {country} ({new_proxy.split('@')[-1] if '@' in new_proxy else new_proxy})")
-                            return True
-                        
-                        elif country == 'BLACKLISTED':
-                            logging.warning(f"⚠️ 新代理IP在黑名单中，重试...")
-                        elif country:
-                            logging.warning(f"⚠️ 新代理国家 {country} 不符合目标 {self.target_country}，重试...")
-                        else:
-                            logging.warning("⚠️ 新代理国家检测失败，重试...")
-                    
-                    else:
-                        logging.error("❌ 获取新代理返回空值")
+            # 并发获取并验证多个候选代理，第一个符合目标国家的胜出，其余任务取消
+            tasks = [
+                asyncio.create_task(self._verify_candidate(newip_func, attempt, max_attempts))
+                for attempt in range(1, max_attempts + 1)
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        result = await next_done
+                    except Exception as e:
+                        logging.error(f"❌ 获取新代理失败: {e}")
+                        continue
                     
-                    if attempt < max_attempts - 1:
-                        await asyncio.sleep(2)
+                    if result:
+                        new_proxy, country = result
+                        old_proxy = current_proxy
+                        current_proxy = new_proxy
+                        proxy_stats['current_proxy'] = new_proxy
+                        proxy_stats['current_country'] = country
+                        proxy_stats['proxy_switches'] += 1
+                        self.last_country = country
                         
-                except Exception as e:
-                    logging.error(f"❌ 获取新代理失败 (尝试 {attempt + 1}): {e}")
-                    if attempt < max_attempts - 1:
-                        await asyncio.sleep(2)
+                        logging.info(f"✅ 代理切换成功: {country} ({new_proxy.split('@')[-1] if '@' in new_proxy else new_proxy})")
+                        return True
+            finally:
+                for task in tasks:
+                    task.cancel()
             
             logging.error(f"❌ 在 {max_attempts} 次尝试后仍无法获取符合要求的代理")
             return False
@@ -497,20 +553,42 @@ class CountryMonitor:
             logging.error(f"❌ 代理切换过程异常: {e}")
             return False
     
+    async def _verify_candidate(self, newip_func, attempt, max_attempts):
+        """获取一个候选代理并验证国家，符合目标时返回 (代理, 国家)"""
+        new_proxy = await newip_func()
+        
+        if not new_proxy:
+            logging.error("❌ 获取新代理返回空值")
+            return None
+        
+        logging.info(f"🧪 验证新代理国家 (候选 {attempt}/{max_attempts})")
+        # 使用统一的检测方法
+        country = await self.detect_proxy_country(new_proxy)
+        
+        if country == self.target_country:
+            return new_proxy, country
+        elif country == 'BLACKLISTED':
+            logging.warning("⚠️ 候选代理IP在黑名单中")
+        elif country:
+            logging.warning(f"⚠️ 候选代理国家 {country} 不符合目标 {self.target_country}")
+        else:
+            logging.warning("⚠️ 候选代理国家检测失败")
+        return None
+    
     def get_stats(self):
         """获取监控统计信息"""
         base_stats = {
             'is_monitoring': self.is_monitoring,
             'target_country': self.target_country,
             'check_interval': self.check_interval,
-            'last_check_time': datetime.fromtimestamp(self.last_check_time).isoformat() if self.last_check_time else None,
+            'last_check_time': self.last_check_time_iso,
             'last_country': self.last_country,
             'consecutive_failures': self.consecutive_failures
         }
         
         # 添加黑名单统计
         if self.proxy_manager:
-            blacklist_stats = self.proxy_manager.get_blacklist_stats()
+            blacklist_stats = self.proxy_manager.get_blacklist_stats(include_meta=False)
             base_stats.update({
                 'blacklist_enabled': blacklist_stats['enabled'],
                 'blacklist_loaded': blacklist_stats['loaded'],
@@ -557,14 +635,129 @@ class CountryMonitor:
             logging.warning("⚠️ 黑名单管理器不可用")
             return None
 
+class RelayProtocol(asyncio.BufferedProtocol):
+    """SOCKS5 隧道单方向转发协议：数据直接读入预分配缓冲区后写给对端传输"""
+    
+    # 批量写出阈值：最多攒 8 个数据块或 128 KiB
+    FLUSH_CHUNKS = 8
+    FLUSH_BYTES = 128 * 1024
+    # 流量统计每 64 次读取汇总一次到全局 proxy_stats
+    STATS_FLUSH_READS = 64
+    
+    def __init__(self, direction, buffer_size, closed):
+        self.direction = direction
+        self.buffer_size = buffer_size
+        self.closed = closed
+        self.transport = None
+        self.peer = None
+        self.stream_protocol = None  # 切换前的 StreamReaderProtocol，连接关闭时需通知它
+        self.pending = []  # 对端写缓冲积压时暂存的数据块，批量写出
+        self.pending_size = 0
+        self._flush_scheduled = False
+        self.stats = proxy_stats  # 预先绑定全局统计字典
+        self.bytes_pending = 0  # 尚未汇总到 proxy_stats 的字节数
+        self.reads = 0
+        self._new_buffer()
+    
+    def _new_buffer(self):
+        self.buffer = bytearray(self.buffer_size)
+        self.view = memoryview(self.buffer)
+    
+    def get_buffer(self, sizehint):
+        return self.view
+    
+    def buffer_updated(self, nbytes):
+        self.bytes_pending += nbytes
+        self.reads += 1
+        if self.reads >= self.STATS_FLUSH_READS:
+            self.publish_stats()
+        
+        # 热路径：属性只查找一次
+        peer = self.peer
+        pending = self.pending
+        
+        if not pending and not peer.get_write_buffer_size():
+            # 对端空闲时立即发送
+            peer.write(self.view[:nbytes])
+            
+            # 对端未能立即写完时传输层可能仍引用该缓冲区，换用新缓冲区避免被覆盖
+            if peer.get_write_buffer_size():
+                self._new_buffer()
+            return
+        
+        # 对端已有积压：暂存数据块，攒够数量或大小后一次写出，否则在本轮事件循环末尾写出
+        pending.append(bytes(self.view[:nbytes]))
+        self.pending_size += nbytes
+        if len(pending) >= self.FLUSH_CHUNKS or self.pending_size >= self.FLUSH_BYTES:
+            self.flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+    
+    def flush(self):
+        self._flush_scheduled = False
+        if not self.pending:
+            return
+        
+        if HAS_SENDMSG:
+            self.peer.writelines(self.pending)
+        else:
+            self.peer.write(b''.join(self.pending))
+        self.pending.clear()
+        self.pending_size = 0
+    
+    def publish_stats(self):
+        self.stats['bytes_transferred'] += self.bytes_pending
+        self.bytes_pending = 0
+        self.reads = 0
+    
+    def eof_received(self):
+        # 返回 False 由传输自行关闭，随后在 connection_lost 中关闭对端
+        return False
+    
+    def pause_writing(self):
+        # 本端写缓冲超过高水位，暂停读取对端
+        self.peer.pause_reading()
+    
+    def resume_writing(self):
+        self.peer.resume_reading()
+    
+    def connection_lost(self, exc):
+        if self.closed.done():
+            return
+        
+        if exc:
+            logging.debug(f"🔄 SOCKS5数据转发结束 ({self.direction}): {exc}")
+        self.flush()
+        self.publish_stats()
+        self.peer.close()
+        self.closed.set_result(None)
+        
+        # 让原 StreamWriter.wait_closed() 等待者正常结束
+        if self.stream_protocol is not None:
+            self.stream_protocol.connection_lost(exc)
+
 class SOCKS5Server:
     """完整的 SOCKS5 代理服务器 - 增强安全版本（支持认证）"""
     
+    # 数据转发参数：每个方向预分配 64 KiB 接收缓冲区；不再逐块 drain，
+    # 写缓冲超过 1 MiB 时由 pause_writing 暂停读取对端，降到 256 KiB 以下再恢复
+    PIPE_READ_SIZE = 64 * 1024
+    WRITE_BUFFER_HIGH = 1 << 20
+    WRITE_BUFFER_LOW = 256 * 1024
+    # StreamReader 缓冲上限（握手阶段使用），调大后读取端不会过早暂停
+    STREAM_LIMIT = 1 << 20
+    # 自动获取代理失败后的这段时间（秒）内，无缓存代理的新连接在握手前直接拒绝
+    PROXY_FETCH_RETRY_DELAY = 5
+    
     def __init__(self, host='0.0.0.0', port=1080, username=None, password=None):
         self.host = host
         self.port = port
         self.running = False
         self.server = None
+        self._stopped = asyncio.Event()
+        self._proxy_fetch_failed_at = float('-inf')  # 最近一次自动获取代理失败的时间（monotonic）
+        self._proxy_fetch = None  # 正在进行的自动获取代理任务，并发连接共享其结果
         # 🔐 新增SOCKS5认证支持
         self.username = username
         self.password = password
@@ -579,15 +772,16 @@ class SOCKS5Server:
         """启动 SOCKS5 服务器"""
         try:
             self.running = True
+            self._stopped.clear()
             self.server = await asyncio.start_server(
-                self.handle_client, self.host, self.port
+                self.handle_client, self.host, self.port, limit=self.STREAM_LIMIT
             )
             
             auth_info = f" (认证: {self.username})" if self.auth_required else " (无认证)"
             logging.info(f"🚀 SOCKS5 服务器已启动: {self.host}:{self.port}{auth_info}")
             
-            async with self.server:
-                await self.server.serve_forever()
+            # start_server 已开始接受连接，这里只需等待停止信号
+            await self._stopped.wait()
                 
         except Exception as e:
             logging.error(f"❌ SOCKS5 服务器启动失败: {e}")
@@ -596,10 +790,17 @@ class SOCKS5Server:
     async def stop(self):
         """停止 SOCKS5 服务器"""
         self.running = False
+        self._stopped.set()
         if self.server:
-            self.server.close()
-            await self.server.wait_closed()
+            server, self.server = self.server, None
+            server.close()
+            await server.wait_closed()
             logging.info("🛑 SOCKS5 服务器已停止")
+        
+        # 关闭 newip_async 使用的持久异步客户端，释放保持的长连接
+        close_async_client = safe_import_getip('close_async_client')
+        if close_async_client:
+            await close_async_client()
     
     async def handle_client(self, reader, writer):
         """处理客户端连接"""
@@ -610,8 +811,17 @@ class SOCKS5Server:
             logging.info(f"📱 新SOCKS5客户端连接: {client_addr}")
         
         proxy_stats['connections_count'] += 1
+        tune_tcp_socket(writer)
         
         try:
+            # 没有缓存代理且刚获取失败时直接拒绝，省去握手和连接请求的往返；
+            # 握手前只读缓存，不触发获取，未认证的连接不会消耗代理API
+            if not current_proxy and time.monotonic() - self._proxy_fetch_failed_at < self.PROXY_FETCH_RETRY_DELAY:
+                logging.warning(f"❌ 没有可用的代理，拒绝客户端连接: {client_addr}")
+                writer.write(b'\x05\xFF')
+                await writer.drain()
+                return
+            
             # SOCKS5 握手
             auth_method = await self.socks5_handshake(reader, writer)
             if auth_method is None:
@@ -627,7 +837,15 @@ class SOCKS5Server:
             if not target_host:
                 return
             
-            await self.proxy_connection(target_host, target_port, reader, writer)
+            # 认证通过后才获取代理（无缓存代理时自动获取）
+            proxy_url = await self.get_current_proxy()
+            if not proxy_url:
+                logging.error("❌ 没有可用的代理")
+                writer.write(b'\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00')
+                await writer.drain()
+                return
+            
+            await self.proxy_connection(proxy_url, target_host, target_port, reader, writer)
             
         except Exception as e:
             if security_config['enable_access_log']:
@@ -717,32 +935,36 @@ class SOCKS5Server:
     async def socks5_connect_request(self, reader, writer):
         """处理 SOCKS5 连接请求"""
         try:
-            data = await asyncio.wait_for(reader.read(1024), timeout=10)
-            
-            if len(data) < 10 or data[0] != 0x05:
-                logging.warning("❌ 无效的 SOCKS5 连接请求")
-                return None, None
-            
-            cmd = data[1]
-            atyp = data[3]
-            
-            if cmd != 0x01:
-                writer.write(b'\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00')
-                await writer.drain()
-                return None, None
-            
-            if atyp == 0x01:  # IPv4
-                target_host = socket.inet_ntoa(data[4:8])
-                target_port = struct.unpack('>H', data[8:10])[0]
-            elif atyp == 0x03:  # 域名
-                addr_len = data[4]
-                target_host = data[5:5+addr_len].decode('utf-8')
-                target_port = struct.unpack('>H', data[5+addr_len:7+addr_len])[0]
-            else:
-                logging.warning(f"❌ 不支持的地址类型: {atyp}")
-                writer.write(b'\x05\x08\x00\x01\x00\x00\x00\x00\x00\x00')
-                await writer.drain()
-                return None, None
+            # 按协议逐段精确读取：4 字节头部 -> 地址 -> 2 字节端口
+            async with asyncio.timeout(10):
+                header = await reader.readexactly(4)
+                
+                if header[0] != 0x05:
+                    logging.warning("❌ 无效的 SOCKS5 连接请求")
+                    return None, None
+                
+                cmd = header[1]
+                atyp = header[3]
+                
+                if cmd != 0x01:
+                    writer.write(b'\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00')
+                    await writer.drain()
+                    return None, None
+                
+                if atyp == 0x01:  # IPv4
+                    target_host = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+                elif atyp == 0x03:  # 域名
+                    addr_len = (await reader.readexactly(1))[0]
+                    target_host = (await reader.readexactly(addr_len)).decode('utf-8')
+                elif atyp == 0x04:  # IPv6
+                    target_host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+                else:
+                    logging.warning(f"❌ 不支持的地址类型: {atyp}")
+                    writer.write(b'\x05\x08\x00\x01\x00\x00\x00\x00\x00\x00')
+                    await writer.drain()
+                    return None, None
+                
+                target_port = _PORT_STRUCT.unpack(await reader.readexactly(2))[0]
             
             if security_config['enable_access_log']:
                 logging.info(f"🎯 SOCKS5连接目标: {target_host}:{target_port}")
@@ -752,25 +974,20 @@ class SOCKS5Server:
             logging.error(f"❌ 解析SOCKS5连接请求失败: {e}")
             return None, None
     
-    async def proxy_connection(self, target_host, target_port, client_reader, client_writer):
+    async def proxy_connection(self, proxy_url, target_host, target_port, client_reader, client_writer):
         """通过上游代理连接目标"""
-        proxy_url = self.get_current_proxy()
-        
-        if not proxy_url:
-            logging.error("❌ 没有可用的代理")
-            client_writer.write(b'\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00')
-            await client_writer.drain()
-            return
-        
         try:
             proxy_info = self.parse_proxy_url(proxy_url)
             if not proxy_info:
                 raise Exception("无效的代理URL")
             
             proxy_reader, proxy_writer = await asyncio.wait_for(
-                asyncio.open_connection(proxy_info['host'], proxy_info['port']),
+                asyncio.open_connection(
+                    proxy_info['host'], proxy_info['port'], limit=self.STREAM_LIMIT
+                ),
                 timeout=10
             )
+            tune_tcp_socket(proxy_writer)
             
             success = await self.upstream_socks5_handshake(
                 proxy_reader, proxy_writer, proxy_info
@@ -789,17 +1006,23 @@ class SOCKS5Server:
             client_writer.write(b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00')
             await client_writer.drain()
             
+            if country_monitor:
+                country_monitor.report_upstream_success()
+            
             if security_config['enable_access_log']:
                 logging.info(f"✅ SOCKS5代理连接建立: {target_host}:{target_port}")
             
-            await asyncio.gather(
-                self.pipe_data(client_reader, proxy_writer, "客户端->代理"),
-                self.pipe_data(proxy_reader, client_writer, "代理->客户端"),
-                return_exceptions=True
-            )
+            for stream_writer in (client_writer, proxy_writer):
+                stream_writer.transport.set_write_buffer_limits(
+                    high=self.WRITE_BUFFER_HIGH, low=self.WRITE_BUFFER_LOW
+                )
+            
+            await self.pipe_data(client_reader, client_writer, proxy_reader, proxy_writer)
             
         except Exception as e:
             logging.error(f"❌ SOCKS5代理连接失败: {e}")
+            if country_monitor:
+                country_monitor.report_upstream_failure()
             try:
                 client_writer.write(b'\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00')
                 await client_writer.drain()
@@ -841,7 +1064,8 @@ class SOCKS5Server:
             
             await writer.drain()
             
-            response = await asyncio.wait_for(reader.read(2), timeout=10)
+            async with asyncio.timeout(10):
+                response = await reader.readexactly(2)
             
             if len(response) != 2 or response[0] != 0x05:
                 return False
@@ -852,11 +1076,11 @@ class SOCKS5Server:
                 
                 username = proxy_info['username'].encode('utf-8')
                 password = proxy_info['password'].encode('utf-8')
-                auth_data = struct.pack('B', len(username)) + username + struct.pack('B', len(password)) + password
-                writer.write(b'\x01' + auth_data)
+                writer.write(b''.join((b'\x01', _PACK_B(len(username)), username, _PACK_B(len(password)), password)))
                 await writer.drain()
                 
-                auth_response = await asyncio.wait_for(reader.read(2), timeout=10)
+                async with asyncio.timeout(10):
+                    auth_response = await reader.readexactly(2)
                 if auth_response != b'\x01\x00':
                     return False
             
@@ -872,21 +1096,29 @@ class SOCKS5Server:
     async def upstream_connect_request(self, reader, writer, target_host, target_port):
         """请求上游代理连接目标"""
         try:
-            if target_host.replace('.', '').isdigit():
-                addr_data = b'\x01' + socket.inet_aton(target_host)
-            else:
-                target_host_bytes = target_host.encode('utf-8')
-                addr_data = b'\x03' + struct.pack('B', len(target_host_bytes)) + target_host_bytes
-            
-            request_data = b'\x05\x01\x00' + addr_data + struct.pack('>H', target_port)
-            writer.write(request_data)
+            writer.write(build_socks5_connect_request(target_host, target_port))
             await writer.drain()
             
-            response = await asyncio.wait_for(reader.read(1024), timeout=15)
-            
-            if len(response) < 2 or response[0] != 0x05 or response[1] != 0x00:
-                logging.error(f"❌ 上游代理连接失败，响应码: {response[1] if len(response) > 1 else 'unknown'}")
-                return False
+            # 先读 4 字节响应头，再按 ATYP 精确读取绑定地址和端口，避免多读隧道数据
+            async with asyncio.timeout(15):
+                response = await reader.readexactly(4)
+                
+                if response[0] != 0x05 or response[1] != 0x00:
+                    logging.error(f"❌ 上游代理连接失败，响应码: {response[1]}")
+                    return False
+                
+                atyp = response[3]
+                if atyp == 0x01:
+                    addr_len = 4
+                elif atyp == 0x04:
+                    addr_len = 16
+                elif atyp == 0x03:
+                    addr_len = (await reader.readexactly(1))[0]
+                else:
+                    logging.error(f"❌ 上游代理响应地址类型无效: {atyp}")
+                    return False
+                
+                await reader.readexactly(addr_len + 2)
             
             return True
             
@@ -894,47 +1126,77 @@ class SOCKS5Server:
             logging.error(f"❌ 上游代理连接请求失败: {e}")
             return False
     
-    async def pipe_data(self, reader, writer, direction):
-        """数据转发"""
+    async def pipe_data(self, client_reader, client_writer, proxy_reader, proxy_writer):
+        """数据转发：握手完成后将两端传输切换为 RelayProtocol，直接读入预分配缓冲区"""
+        loop = asyncio.get_running_loop()
+        client_transport = client_writer.transport
+        proxy_transport = proxy_writer.transport
+        
+        upstream = RelayProtocol("客户端->代理", self.PIPE_READ_SIZE, loop.create_future())
+        downstream = RelayProtocol("代理->客户端", self.PIPE_READ_SIZE, loop.create_future())
+        upstream.transport, upstream.peer = client_transport, proxy_transport
+        downstream.transport, downstream.peer = proxy_transport, client_transport
+        
         try:
-            while True:
-                data = await reader.read(8192)
-                if not data:
-                    break
-                
-                writer.write(data)
-                await writer.drain()
-                
-                proxy_stats['bytes_transferred'] += len(data)
+            for reader, protocol in ((client_reader, upstream), (proxy_reader, downstream)):
+                # 握手阶段 StreamReader 已缓冲的数据先转发给对端（取完后传输保持暂停，切换协议后再恢复）
+                leftover = await take_buffered(reader, protocol.transport)
+                if leftover:
+                    protocol.peer.write(leftover)
+                    proxy_stats['bytes_transferred'] += len(leftover)
                 
-        except Exception as e:
-            logging.debug(f"🔄 SOCKS5数据转发结束 ({direction}): {e}")
+                protocol.stream_protocol = protocol.transport.get_protocol()
+                protocol.transport.set_protocol(protocol)
+                if reader.at_eof() or protocol.transport.is_closing():
+                    protocol.transport.close()
+                    protocol.connection_lost(None)
+                else:
+                    protocol.transport.resume_reading()
+            
+            await asyncio.gather(upstream.closed, downstream.closed)
         finally:
-            try:
-                writer.close()
-            except:
-                pass
+            client_transport.close()
+            proxy_transport.close()
+    
+    async def get_current_proxy(self):
+        """获取当前代理（无代理时通过异步 newip_async 获取，不阻塞事件循环；并发请求合并为一次获取）"""
+        if current_proxy:
+            return current_proxy
+        
+        if self._proxy_fetch is None:
+            self._proxy_fetch = asyncio.ensure_future(self._fetch_current_proxy())
+            self._proxy_fetch.add_done_callback(self._clear_proxy_fetch)
+        
+        # shield：单个连接被取消时不影响其他连接共享的获取任务
+        return await asyncio.shield(self._proxy_fetch)
+    
+    def _clear_proxy_fetch(self, future):
+        if self._proxy_fetch is future:
+            self._proxy_fetch = None
     
-    def get_current_proxy(self):
-        """获取当前代理"""
+    async def _fetch_current_proxy(self):
+        """自动获取代理并设为当前代理"""
         global current_proxy
         
-        if not current_proxy:
-            logging.info("🔄 当前无代理，尝试自动获取...")
-            try:
-                newip_func = safe_import_getip()
-                if newip_func:
-                    current_proxy = newip_func()
-                    if current_proxy:
-                        proxy_stats['current_proxy'] = current_proxy
-                        proxy_stats['proxy_switches'] += 1
-                        logging.info(f"✅ 自动获取代理成功: {current_proxy}")
-                    else:
-                        logging.error("❌ 获取代理返回空值")
+        logging.info("🔄 当前无代理，尝试自动获取...")
+        try:
+            newip_func = safe_import_getip('newip_async')
+            if newip_func:
+                new_proxy = await newip_func()
+                if new_proxy:
+                    current_proxy = new_proxy
+                    proxy_stats['current_proxy'] = new_proxy
+                    proxy_stats['proxy_switches'] += 1
+                    logging.info(f"✅ 自动获取代理成功: {new_proxy}")
                 else:
-                    logging.error("❌ getip 模块不可用")
-            except Exception as e:
-                logging.error(f"❌ 自动获取代理失败: {e}")
+                    logging.error("❌ 获取代理返回空值")
+            else:
+                logging.error("❌ getip 模块不可用")
+        except Exception as e:
+            logging.error(f"❌ 自动获取代理失败: {e}")
+        
+        if not current_proxy:
+            self._proxy_fetch_failed_at = time.monotonic()
         
         return current_proxy
 
@@ -1618,47 +1880,39 @@ def test_proxy():
                 'error': '当前没有设置代理'
             })
         
-        proxy_for_curl = current_proxy
-        if proxy_for_curl.startswith('socks5://'):
-            proxy_for_curl = proxy_for_curl[9:]
+        if not main_loop or not main_loop.is_running():
+            return jsonify({
+                'success': False,
+                'error': '主事件循环不可用'
+            }), 500
         
-        cmd = [
-            'curl', '-s', '--connect-timeout', '10', '--max-time', '15',
-            '-x', f'socks5://{proxy_for_curl}',
-            'https://ipinfo.io?token=68cdce81ca2b21'
-        ]
+        from modules.country_proxy_manager import fetch_ipinfo
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=20)
+        proxy_url = current_proxy if '://' in current_proxy else f'socks5://{current_proxy}'
+        future = asyncio.run_coroutine_threadsafe(fetch_ipinfo(proxy_url), main_loop)
+        data = future.result(timeout=20)
         
-        if result.returncode == 0:
-            try:
-                data = json.loads(result.stdout)
-                ip = data.get('ip', 'Unknown')
-                country = data.get('country', 'Unknown')
-                
-                proxy_stats['current_country'] = country
-                
-                logging.info(f"✅ 代理测试成功: IP={ip}, 国家={country}")
-                return jsonify({
-                    'success': True,
-                    'ip': ip,
-                    'country': country,
-                    'full_info': data
-                })
-            except json.JSONDecodeError:
-                return jsonify({
-                    'success': False,
-                    'error': 'IP检测服务返回无效数据'
-                })
+        if data is not None:
+            ip = data.get('ip', 'Unknown')
+            country = data.get('country', 'Unknown')
+            
+            proxy_stats['current_country'] = country
+            
+            logging.info(f"✅ 代理测试成功: IP={ip}, 国家={country}")
+            return jsonify({
+                'success': True,
+                'ip': ip,
+                'country': country,
+                'full_info': data
+            })
         else:
-            error_msg = result.stderr or '代理连接失败'
-            logging.error(f"❌ 代理测试失败: {error_msg}")
+            logging.error("❌ 代理测试失败: IP检测服务返回错误")
             return jsonify({
                 'success': False,
-                'error': error_msg
+                'error': 'IP检测服务返回无效数据'
             })
             
-    except subprocess.TimeoutExpired:
+    except TimeoutError:
         return jsonify({
             'success': False,
             'error': '代理测试超时'
@@ -1876,17 +2130,21 @@ def force_update_blacklist():
             logging.info("🔄 Web界面触发黑名单强制更新...")
             
             # 记录更新前状态
-            old_size = len(proxy_manager.ip_blacklist)
+            old_size = proxy_manager.blacklist_size
             old_update_time = proxy_manager.blacklist_last_update
             
             # 重置更新时间，强制更新
             proxy_manager.blacklist_last_update = 0
             
-            # 执行同步下载
-            success = proxy_manager._sync_download_blacklist()
+            # 主事件循环运行时与后台更新共用同一个下载任务，否则同步下载
+            if main_loop and main_loop.is_running():
+                future = asyncio.run_coroutine_threadsafe(proxy_manager.update_ip_blacklist(), main_loop)
+                success = future.result(timeout=120)
+            else:
+                success = proxy_manager._sync_download_blacklist()
             
             if success:
-                new_size = len(proxy_manager.ip_blacklist)
+                new_size = proxy_manager.blacklist_size
                 logging.info(f"✅ Web界面黑名单强制更新成功: {old_size} -> {new_size} 条记录")
                 
                 return jsonify({
@@ -1937,7 +2195,7 @@ def debug_blacklist():
             # 基本状态
             'enabled': manager.enable_blacklist,
             'loaded': manager.blacklist_loaded,
-            'size': len(manager.ip_blacklist),
+            'size': manager.blacklist_size,
             'url': manager.blacklist_url,
             
             # 时间相关
@@ -2084,6 +2342,7 @@ def signal_handler(signum, frame):
     if country_monitor:
         country_monitor.stop_monitoring()
     
+    stop_logging()
     sys.exit(0)
 
 async def main():
@@ -2125,26 +2384,28 @@ async def main():
     # 初始化国家监控
     country_monitor = init_country_monitor()
     
-    # 打印启动信息（增强安全版）
-    print("\n" + "="*70)
-    print("🐱 ProxyCat - 智能代理池管理系统 (增强安全版)")
-    print("="*70)
-    print(f"🚀 SOCKS5 代理端口: {proxy_stats['port']} (用户名: {security_config['socks5_username']})")
-    print(f"🌐 Web 管理界面: http://localhost:{proxy_stats['web_port']}{security_config['web_access_suffix']}")
-    print(f"🎯 目标国家: {proxy_stats['target_country']}")
-    print(f"🤖 自动监控间隔: {country_monitor.check_interval}秒")
-    
-    # 显示安全功能状态
-    print("🔐 安全功能状态:")
-    print(f"   ✅ SOCKS5认证: 启用 (用户: {security_config['socks5_username']})")
-    print(f"   ✅ Web访问后缀: {security_config['web_access_suffix']}")
+    # 打印启动信息（增强安全版）：先拼接完整横幅，再一次性写出
+    banner = [
+        "",
+        "="*70,
+        "🐱 ProxyCat - 智能代理池管理系统 (增强安全版)",
+        "="*70,
+        f"🚀 SOCKS5 代理端口: {proxy_stats['port']} (用户名: {security_config['socks5_username']})",
+        f"🌐 Web 管理界面: http://localhost:{proxy_stats['web_port']}{security_config['web_access_suffix']}",
+        f"🎯 目标国家: {proxy_stats['target_country']}",
+        f"🤖 自动监控间隔: {country_monitor.check_interval}秒",
+        # 显示安全功能状态
+        "🔐 安全功能状态:",
+        f"   ✅ SOCKS5认证: 启用 (用户: {security_config['socks5_username']})",
+        f"   ✅ Web访问后缀: {security_config['web_access_suffix']}",
+    ]
     
     if security_config['web_allowed_ips']:
-        print(f"   ✅ IP访问限制: 启用 ({len(security_config['web_allowed_ips'])} 个允许的IP/网段)")
+        banner.append(f"   ✅ IP访问限制: 启用 ({len(security_config['web_allowed_ips'])} 个允许的IP/网段)")
     else:
-        print("   ⚠️  IP访问限制: 禁用")
+        banner.append("   ⚠️  IP访问限制: 禁用")
     
-    print(f"   {'✅' if security_config['enable_access_log'] else '❌'} 访问日志: {'启用' if security_config['enable_access_log'] else '禁用'}")
+    banner.append(f"   {'✅' if security_config['enable_access_log'] else '❌'} 访问日志: {'启用' if security_config['enable_access_log'] else '禁用'}")
     
     # 显示黑名单状态
     if country_monitor and hasattr(country_monitor, 'get_blacklist_stats'):
@@ -2159,41 +2420,43 @@ async def main():
                         'remote_async': '远程异步'
                     }.get(blacklist_stats['source'], '未知')
                     
-                    print(f"🛡️  IP黑名单: ✅ 已加载 ({blacklist_stats['size']} 条记录, 来源: {source_text})")
+                    banner.append(f"🛡️  IP黑名单: ✅ 已加载 ({blacklist_stats['size']} 条记录, 来源: {source_text})")
                     
                     if blacklist_stats['needs_update']:
-                        print("⏰ 黑名单将在后台自动更新")
+                        banner.append("⏰ 黑名单将在后台自动更新")
                     else:
                         hours_old = blacklist_stats['hours_since_update']
-                        print(f"📅 黑名单状态: 最新 (上次更新: {hours_old:.1f}小时前)")
+                        banner.append(f"📅 黑名单状态: 最新 (上次更新: {hours_old:.1f}小时前)")
                 else:
-                    print("🛡️  IP黑名单: ❌ 加载失败")
+                    banner.append("🛡️  IP黑名单: ❌ 加载失败")
             else:
-                print("🛡️  IP黑名单: 🚫 功能已禁用")
+                banner.append("🛡️  IP黑名单: 🚫 功能已禁用")
         except Exception as e:
-            print("🛡️  IP黑名单: ⚠️ 状态检查失败")
+            banner.append("🛡️  IP黑名单: ⚠️ 状态检查失败")
             logging.debug(f"黑名单状态检查失败: {e}")
     else:
-        print("🛡️  IP黑名单: ⚠️ 功能不可用")
+        banner.append("🛡️  IP黑名单: ⚠️ 功能不可用")
     
-    print("="*70)
+    banner.append("="*70)
     
     # 检查 getip 模块
     getip_func = safe_import_getip()
     if getip_func:
-        print("✅ getip 模块加载成功")
+        banner.append("✅ getip 模块加载成功")
     else:
-        print("❌ getip 模块加载失败")
-        print("   请确保 modules/getip.py 文件存在且配置正确")
-    
-    print("="*70)
-    print("💡 使用提示:")
-    print(f"   1. 访问 http://localhost:{proxy_stats['web_port']}{security_config['web_access_suffix']} 管理代理")
-    print(f"   2. SOCKS5代理: localhost:{proxy_stats['port']} (账号: {security_config['socks5_username']})")
-    print("   3. 黑名单定时更新已修复，每5分钟检查一次")
-    print("   4. 强制更新功能已修复，Web界面按钮正常工作")
-    print("   5. 增强安全功能已启用，包括访问控制和认证")
-    print("="*70)
+        banner.append("❌ getip 模块加载失败")
+        banner.append("   请确保 modules/getip.py 文件存在且配置正确")
+    
+    banner.append("="*70)
+    banner.append("💡 使用提示:")
+    banner.append(f"   1. 访问 http://localhost:{proxy_stats['web_port']}{security_config['web_access_suffix']} 管理代理")
+    banner.append(f"   2. SOCKS5代理: localhost:{proxy_stats['port']} (账号: {security_config['socks5_username']})")
+    banner.append("   3. 黑名单定时更新已修复，每5分钟检查一次")
+    banner.append("   4. 强制更新功能已修复，Web界面按钮正常工作")
+    banner.append("   5. 增强安全功能已启用，包括访问控制和认证")
+    banner.append("="*70)
+    sys.stdout.write("\n".join(banner) + "\n")
+    sys.stdout.flush()
     
     # 启动Flask应用（在单独线程中）
     flask_thread = threading.Thread(
@@ -2220,15 +2483,9 @@ async def main():
             country_monitor.stop_monitoring()
 
 if __name__ == '__main__':
-    # 设置日志
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('logs/proxycat.log', encoding='utf-8')
-        ]
-    )
+    # 设置日志（队列 + 后台监听线程，磁盘写入不阻塞事件循环）
+    setup_logging('logs/proxycat.log')
+    install_event_loop_policy()
     
     # 运行主函数
     try:
@@ -2238,4 +2495,6 @@ if __name__ == '__main__':
     except Exception as e:
         logging.error(f"❌ 程序启动失败: {e}")
         import traceback
-        traceback.print_exc()       
+        traceback.print_exc()
+    finally:
+        stop_logging()       
@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 import os
 import time
-import glob
+from concurrent.futures import ThreadPoolExecutor
+
+def remove_file(path):
+    """删除单个文件，返回异常（成功时为 None）"""
+    try:
+        os.remove(path)
+        return None
+    except Exception as e:
+        return e
 
 def cleanup_logs():
     logs_dir = '/app/logs'  # Docker容器内的路径
@@ -16,15 +24,22 @@ def cleanup_logs():
     cutoff_time = current_time - (max_age_days * 24 * 3600)
     cleaned_count = 0
     total_freed_mb = 0
+    to_delete = []
     
-    log_files = glob.glob(os.path.join(logs_dir, '*.log*'))
+    # 与 glob('*.log*') 相同的匹配规则；DirEntry.stat() 复用目录读取结果，省去逐个 os.stat
+    with os.scandir(logs_dir) as it:
+        log_files = [
+            entry for entry in it
+            if '.log' in entry.name and not entry.name.startswith('.') and entry.is_file()
+        ]
     
     print(f"检查日志目录: {logs_dir}")
     print(f"找到 {len(log_files)} 个日志文件")
     
-    for log_file in log_files:
+    for entry in log_files:
+        log_file = entry.path
         try:
-            file_stat = os.stat(log_file)
+            file_stat = entry.stat()
             file_size_mb = file_stat.st_size / (1024 * 1024)
             file_age = file_stat.st_mtime
             file_age_days = (current_time - file_age) / (24 * 3600)
@@ -40,16 +55,26 @@ def cleanup_logs():
                 reason = f"过大({file_size_mb:.1f}MB > {max_size_mb}MB)"
             
             if should_delete:
-                os.remove(log_file)
-                cleaned_count += 1
-                total_freed_mb += file_size_mb
-                print(f"✅ 删除: {os.path.basename(log_file)} - {reason}")
+                to_delete.append((log_file, file_size_mb, reason))
             else:
                 print(f"⏭️  保留: {os.path.basename(log_file)} - {file_age_days:.1f}天, {file_size_mb:.1f}MB")
                 
         except Exception as e:
             print(f"❌ 清理失败 {log_file}: {e}")
     
+    # 各文件删除互不依赖，并发执行
+    if to_delete:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(remove_file, (item[0] for item in to_delete)))
+        
+        for (log_file, file_size_mb, reason), error in zip(to_delete, results):
+            if error:
+                print(f"❌ 清理失败 {log_file}: {error}")
+                continue
+            cleaned_count += 1
+            total_freed_mb += file_size_mb
+            print(f"✅ 删除: {os.path.basename(log_file)} - {reason}")
+    
     if cleaned_count > 0:
         print(f"🎉 清理完成: 删除 {cleaned_count} 个文件，释放 {total_freed_mb:.1f}MB 空间")
     else:
@@ -0,0 +1,151 @@
+# modules/_getip_tests.py
+# getip 模块的调试与测试函数（仅在直接运行 getip.py 时导入）
+
+import os
+
+try:
+    from modules.getip import load_config, isp_exclusion_pattern
+except ImportError:
+    # 直接运行 modules/getip.py 时 modules 包不在 sys.path 中
+    from getip import load_config, isp_exclusion_pattern
+
+def debug_config():
+    """调试配置加载情况"""
+    print("🔧 调试配置加载情况:")
+    print("="*50)
+    
+    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.ini')
+    print(f"配置文件路径: {config_path}")
+    print(f"配置文件是否存在: {os.path.exists(config_path)}")
+    
+    if os.path.exists(config_path):
+        print(f"\n配置文件内容:")
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+                for i, line in enumerate(lines, 1):
+                    if 'exclude_isps' in line.lower():
+                        print(f"  第{i}行: {line.strip()} ⭐")
+                    elif line.strip() and not line.strip().startswith('#'):
+                        print(f"  第{i}行: {line.strip()}")
+        except Exception as e:
+            print(f"读取配置文件失败: {e}")
+    
+    # 🔧 使用修复后的配置加载逻辑
+    config = load_config()
+    
+    print(f"\n解析后的配置:")
+    for key, value in config.items():
+        if 'password' in key.lower():
+            print(f"  {key} = {'*' * len(str(value)) if value else '(空)'}")
+        else:
+            print(f"  {key} = {value}")
+    
+    print("\n🔧 ISP过滤解析结果:")
+    print(f"  最终配置值: '{config['exclude_isps']}'")
+    
+    exclude_isps = config['exclude_isps_parsed']
+    if exclude_isps:
+        print(f"  解析后的ISP列表: {exclude_isps}")
+        print(f"  ISP过滤状态: 启用")
+    else:
+        print(f"  解析后的ISP列表: []")
+        print(f"  ISP过滤状态: 禁用")
+    
+    print("="*50)
+
+def test_isp_filtering():
+    """测试ISP过滤功能"""
+    print("🧪 测试ISP过滤功能:")
+    print("="*50)
+    
+    # 模拟一些代理数据
+    test_proxies = [
+        {"id": "1", "host": "Verizon Communications Inc.", "ipaddress": "1.1.1.1"},
+        {"id": "2", "host": "T-Mobile USA, Inc.", "ipaddress": "2.2.2.2"},
+        {"id": "3", "host": "Cox Communications", "ipaddress": "3.3.3.3"},
+        {"id": "4", "host": "AT&T Services Inc.", "ipaddress": "4.4.4.4"},
+        {"id": "5", "host": "Spectrum Internet Services", "ipaddress": "5.5.5.5"},
+    ]
+    
+    exclude_isps = load_config()['exclude_isps_parsed']
+    
+    print(f"当前排除的ISP: {exclude_isps}")
+    print("\n代理过滤测试:")
+    
+    # 与 filter_proxy_list 使用同一个预编译正则，测试结果与实际过滤一致
+    search = isp_exclusion_pattern(exclude_isps).search if exclude_isps else None
+    
+    for proxy in test_proxies:
+        proxy_id = proxy.get('id')
+        
+        match = search(proxy.get('host', '')) if search else None
+        excluded = match is not None
+        matched_isp = match.group(0).lower() if match else None
+        
+        status = "❌ 被排除" if excluded else "✅ 通过"
+        reason = f" (匹配: '{matched_isp}')" if matched_isp else ""
+        
+        print(f"  代理{proxy_id}: {proxy['host']} -> {status}{reason}")
+    
+    print("="*50)
+
+def test_proxy_format():
+    """测试不同的代理格式"""
+    print("🧪 测试代理格式解析:")
+    print("="*50)
+    
+    # 模拟API响应测试
+    test_data_with_auth = {
+        "status": {"code": "1000", "message": "Success"},
+        "data": {
+            "ipaddress": "152.53.36.101",
+            "port": "1080",
+            "username": "DVS-mc9-D496",
+            "password": "n3d8toW",
+            "city": "Los Angeles",
+            "region": "California"
+        }
+    }
+    
+    test_data_no_auth = {
+        "status": {"code": "1000", "message": "Success"},
+        "data": {
+            "ipaddress": "152.53.36.101",
+            "port": "1080",
+            "username": "",
+            "password": "",
+            "city": "Los Angeles",
+            "region": "California"
+        }
+    }
+    
+    print("1. 带认证信息的代理:")
+    proxy_data = test_data_with_auth['data']
+    username = proxy_data.get('username', '').strip()
+    password = proxy_data.get('password', '').strip()
+    ip = proxy_data.get('ipaddress')
+    port = proxy_data.get('port')
+    
+    if username and password:
+        result = f"socks5://{username}:{password}@{ip}:{port}"
+        print(f"   结果: {result}")
+    else:
+        result = f"socks5://{ip}:{port}"
+        print(f"   结果: {result}")
+    
+    print("\n2. 无认证信息的代理:")
+    proxy_data = test_data_no_auth['data']
+    username = proxy_data.get('username', '').strip()
+    password = proxy_data.get('password', '').strip()
+    ip = proxy_data.get('ipaddress')
+    port = proxy_data.get('port')
+    
+    if username and password:
+        result = f"socks5://{username}:{password}@{ip}:{port}"
+        print(f"   结果: {result}")
+    else:
+        result = f"socks5://{ip}:{port}"
+        print(f"   结果: {result}")
+    
+    print("="*50)
@@ -1,24 +1,178 @@
 # ===== 1. 修改 modules/country_proxy_manager.py =====
 
 import asyncio
+import contextlib
 import aiohttp
+from aiohttp_socks import ProxyConnector
 import json
 import time
 import logging
 import ipaddress
 import os
+import socket
+import struct
+import hashlib
+import random
+import sys
+import tempfile
+import threading
+import queue
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Set, Optional, Dict, Any
 import requests
 
+try:
+    import orjson  # 可选依赖：元数据读写走 C 实现
+except ImportError:
+    orjson = None
+
+_IPV4_STRUCT = struct.Struct('!I')
+# IPv4 区间数组的类型码：32位无符号整数即可容纳，比 'Q' 省一半内存
+_V4_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+def _dump_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _load_json(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# 黑名单解析缓存文件：4字节头长度 + JSON 头（哈希、条目数、类型码、字节序、各段长度）+ 按头中顺序拼接的原始字节段
+# 只包含数据，不使用 pickle，缓存目录被他人写入时也无法借此执行代码
+_PARSED_HEADER_LEN = struct.Struct('!I')
+_PARSED_SECTIONS = ('v4_singles', 'v4_starts', 'v4_ends', 'v6_singles', 'v6_starts', 'v6_ends')
+
+def _pack_u128(values) -> bytes:
+    """IPv6 整数序列按 16 字节大端拼接"""
+    return b''.join(value.to_bytes(16, 'big') for value in values)
+
+def _unpack_u128(blob: bytes) -> list:
+    return [int.from_bytes(blob[i:i + 16], 'big') for i in range(0, len(blob), 16)]
+
+def _ipv4_int(ip: str) -> Optional[int]:
+    """将点分十进制IPv4地址转换为整数，非IPv4地址返回None"""
+    try:
+        return _IPV4_STRUCT.unpack(socket.inet_pton(socket.AF_INET, ip))[0]
+    except (OSError, TypeError):
+        return None
+
+def _ipv6_int(ip: str) -> int:
+    """将IPv6地址转换为整数，格式无效时抛出 OSError"""
+    return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+
+def _pack_ipv4(ip: str) -> bytes:
+    return socket.inet_pton(socket.AF_INET, ip)
+
+@lru_cache(maxsize=16384)
+def _cidr_range(entry: str) -> tuple[int, int, int]:
+    """解析CIDR网段为 (版本, 起始整数, 结束整数)；校验与建索引共用，同一条目只解析一次"""
+    addr, _, bits = entry.partition('/')
+    if ':' not in addr and bits.isdigit():
+        # 常见的 a.b.c.d/m 形式：inet_pton + 位运算，不构造 ipaddress 对象
+        prefix = int(bits)
+        if prefix > 32:
+            raise ValueError(f"无效的IPv4前缀长度: {entry}")
+        mask = (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF
+        start = _IPV4_STRUCT.unpack(socket.inet_pton(socket.AF_INET, addr))[0] & mask
+        return 4, start, start | (~mask & 0xFFFFFFFF)
+    
+    # IPv6 及掩码写法等少见格式仍交给 ipaddress
+    network = ipaddress.ip_network(entry, strict=False)
+    start = int(network.network_address)
+    return network.version, start, start + network.num_addresses - 1
+
+def _merge_ranges(ranges):
+    """将 (起始, 结束) 区间排序并合并重叠或相邻的部分，返回起始列表和结束列表（供 bisect 查找）"""
+    starts, ends = [], []
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + 1:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+def _prune_covered(singles: Set[int], starts, ends) -> Set[int]:
+    """去掉已被合并区间覆盖的单个IP，查找时少一次无意义的集合命中"""
+    if not starts:
+        return singles
+    return {
+        ip for ip in singles
+        if (idx := bisect_right(starts, ip) - 1) < 0 or ip > ends[idx]
+    }
+
+def _ipv4_int_set(ips) -> Set[int]:
+    """批量将IPv4地址转换为整数集合（在C层完成打包与字节序转换）"""
+    ints = array('I')
+    if ints.itemsize != 4:
+        return {_IPV4_STRUCT.unpack(_pack_ipv4(ip))[0] for ip in ips}
+    
+    ints.frombytes(b''.join(map(_pack_ipv4, ips)))
+    if sys.byteorder == 'little':
+        ints.byteswap()
+    return set(ints)
+
+IPINFO_URL = 'https://ipinfo.io?token=68cdce81ca2b21'
+
+async def fetch_ipinfo(proxy_url: str, session: Optional[aiohttp.ClientSession] = None,
+                       timeout: float = 15) -> Optional[dict]:
+    """经SOCKS5代理请求ipinfo.io并返回响应JSON；未传入会话时临时创建一个"""
+    if session is None:
+        connector = ProxyConnector.from_url(proxy_url)
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            return await fetch_ipinfo(proxy_url, session)
+    
+    async with session.get(IPINFO_URL) as response:
+        if response.status != 200:
+            logging.error(f"❌ ipinfo.io请求失败，状态码: {response.status}")
+            return None
+        return _load_json(await response.read())
+
+class _ProxySession:
+    """按代理缓存的会话及其使用计数：被淘汰时仍有请求在用的会话，由最后一个使用者关闭"""
+    __slots__ = ('session', 'created', 'users', 'retired')
+    
+    def __init__(self, session: aiohttp.ClientSession, created: float):
+        self.session = session
+        self.created = created
+        self.users = 0
+        self.retired = False
+    
+    def retire(self) -> list:
+        """标记为已淘汰，返回现在就可以关闭的会话（没有使用者时）"""
+        self.retired = True
+        return [self.session] if self.users == 0 else []
+
 class CountryBasedProxyManager:
     """基于国家检测的智能代理管理器 - 增强本地缓存版"""
     
+    PROXY_SESSION_REUSE = 120     # 秒，此时间内复用同一代理的会话（保留 SOCKS/TLS 长连接）
+    PROXY_SESSION_MAX_AGE = 300   # 秒，超过后清理
+    PROXY_SESSION_LIMIT = 16      # 最多同时保留的代理会话数，超出时淘汰最久未用的
+    COUNTRY_NEGATIVE_TTL = 5      # 秒，国家检测失败后的负缓存时间，避免密集重试
+    COUNTRY_CACHE_MAX = 256       # 国家检测缓存的最大条目数，超出时先清过期条目再淘汰最早写入的
+    ERROR_BACKOFF_BASE = 10       # 秒，监控循环异常后的初始等待时间
+    ERROR_BACKOFF_CAP = 300       # 秒，连续异常时指数退避的上限
+    MIN_CHECK_INTERVAL = 5        # 秒，自适应检测间隔的下限（配置的间隔更短时以配置为准，但至少1秒）
+    BLACKLIST_QUEUE_CHUNKS = 64   # 黑名单下载与解析线程之间最多缓冲的数据块数
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.language = config.get('language', 'cn')
         self.target_country = config.get('target_country', 'US')
         self.check_interval = int(config.get('country_check_interval', 60))
+        # 代理 -> (落地IP, 国家, 过期时间)，有效期短于检测间隔，避免重试时重复探测；
+        # 检测失败时记录 (None, None, 过期时间) 作为短期负缓存
+        self._country_cache: Dict[str, tuple[Optional[str], Optional[str], float]] = {}
+        self._country_cache_ttl = min(self.check_interval / 2, 30)
         self.max_retries = int(config.get('max_retries', 2))
         self.timeout = int(config.get('request_timeout', 10))
         
@@ -30,23 +184,59 @@ class CountryBasedProxyManager:
         self.blacklist_cache_dir = os.path.join('config', 'cache')
         self.blacklist_cache_file = os.path.join(self.blacklist_cache_dir, 'ip_blacklist.txt')
         self.blacklist_meta_file = os.path.join(self.blacklist_cache_dir, 'blacklist_meta.json')
+        self.blacklist_parsed_file = os.path.join(self.blacklist_cache_dir, 'blacklist_parsed.bin')
+        # 元数据内存缓存，仅在文件 mtime 变化时重新读取
+        self._meta_cache: dict = {}
+        self._meta_mtime: Optional[float] = None
         
         # 更新间隔：默认24小时，可从配置读取
         self.blacklist_update_interval = int(config.get('blacklist_update_interval', 86400))
         
         # 确保缓存目录存在
         os.makedirs(self.blacklist_cache_dir, exist_ok=True)
+        # 缓存文件是否存在只在加载/保存时探测，统计接口直接读取该标志
+        self._cache_file_present = os.path.exists(self.blacklist_cache_file)
         
         # 黑名单数据
-        self.ip_blacklist: Set[str] = set()
+        # 条目字符串只在解析和建索引期间保留，之后只留下整数索引和条目数
+        self.blacklist_size = 0                  # 有效条目数（去重后）
+        self._v4_singles: Set[int] = set()       # 单个IPv4（整数形式）
+        self._v6_singles: Set[int] = set()       # 单个IPv6（整数形式）
+        # 网段按版本合并为有序区间 (起始列表, 结束列表)，用 bisect 查找；
+        # IPv4 区间存为连续的 32 位整数数组，IPv6 网段较少保留 Python 列表；
+        # 整体作为一个元组替换，后台线程更新时查询方不会读到不配套的两半
+        self._v4_ranges = (array(_V4_TYPECODE), array(_V4_TYPECODE))
+        self._v6_ranges = ([], [])
+        # 查询结果缓存（每个实例独立，黑名单更新时整体替换）
+        self._is_ip_blacklisted_impl = lru_cache(maxsize=4096)(self._lookup_blacklisted_ip)
         self.blacklist_last_update = 0
         self.blacklist_loaded = False
         
+        # 构造时没有运行中的事件循环则无法立即调度后台更新，留到 start_monitoring 再执行
+        self.pending_startup_update = False
+        # 正在进行的后台下载任务：所有更新入口共用，同一时间只有一次下载写缓存文件
+        self._blacklist_update_task: Optional[asyncio.Task] = None
+        
+        # 复用的 HTTP 会话（必须在运行中的事件循环里创建，见 _ensure_sessions）
+        self._blacklist_session: Optional[aiohttp.ClientSession] = None
+        # 代理URL -> 走该代理的会话条目（含创建时间和使用计数），用于复用国家检测的连接
+        self._proxy_sessions: Dict[str, _ProxySession] = {}
+        
         # 当前代理状态
         self.current_proxy = None
         self.current_country = None
         self.last_check_time = 0
         self.is_monitoring = False
+        # 停止事件让 stop_monitoring 立即结束等待；唤醒事件用于提前触发下一轮检测
+        self._stop_event = asyncio.Event()
+        self._wake_event = asyncio.Event()
+        self._consecutive_errors = 0
+        # 自适应检测间隔（AIMD）：发现变化时减半，连续稳定时逐步放宽
+        self._cur_interval = self.check_interval
+        self._stable_checks = 0
+        # 最近一次检测的代理和时间，用于合并过于密集的重复检测
+        self._last_checked_proxy = None
+        self._last_check_ts = float('-inf')
         
         # 统计信息
         self.stats = {
@@ -69,7 +259,7 @@ class CountryBasedProxyManager:
         try:
             # 1. 首先尝试从本地加载
             if self._load_local_blacklist():
-                logging.info(f"📋 从本地缓存加载黑名单成功，共 {len(self.ip_blacklist)} 条记录")
+                logging.info(f"📋 从本地缓存加载黑名单成功，共 {self.blacklist_size} 条记录")
                 self.stats['blacklist_source'] = 'local'
                 self.blacklist_loaded = True
                 
@@ -77,7 +267,7 @@ class CountryBasedProxyManager:
                 if self._should_update_blacklist():
                     logging.info("⏰ 本地黑名单需要更新，开始后台下载...")
                     # 在后台异步更新（不阻塞主程序）
-                    asyncio.create_task(self._background_update_blacklist())
+                    self._schedule_background_update()
                 else:
                     hours_old = (time.time() - self.blacklist_last_update) / 3600
                     logging.info(f"✅ 本地黑名单较新，无需更新 (上次更新: {hours_old:.1f}小时前)")
@@ -85,7 +275,10 @@ class CountryBasedProxyManager:
             else:
                 # 2. 本地加载失败，尝试立即从远程下载
                 logging.warning("⚠️ 本地黑名单加载失败，尝试从远程下载...")
-                if self.blacklist_url:
+                if self.blacklist_url and self._schedule_background_update():
+                    # 已在事件循环中，异步下载，避免阻塞其他协程
+                    logging.info("📥 黑名单将在后台异步下载")
+                elif self.blacklist_url:
                     success = self._sync_download_blacklist()
                     if success:
                         self.stats['blacklist_source'] = 'remote'
@@ -102,10 +295,31 @@ class CountryBasedProxyManager:
             logging.error(f"❌ 黑名单初始化失败: {e}")
             self.stats['blacklist_source'] = 'empty'
     
+    def _schedule_background_update(self) -> bool:
+        """在运行中的事件循环里调度后台更新；没有事件循环时标记为待执行并返回 False"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.pending_startup_update = True
+            return False
+        
+        self._start_blacklist_update()
+        return True
+    
+    def _start_blacklist_update(self) -> asyncio.Task:
+        """启动后台黑名单下载；已有下载在进行时直接返回该任务，不重复下载"""
+        loop = asyncio.get_running_loop()
+        task = self._blacklist_update_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._background_update_blacklist())
+            self._blacklist_update_task = task
+        return task
+    
     def _load_local_blacklist(self) -> bool:
         """从本地文件加载黑名单"""
         try:
-            if not os.path.exists(self.blacklist_cache_file):
+            self._cache_file_present = os.path.exists(self.blacklist_cache_file)
+            if not self._cache_file_present:
                 logging.debug("📁 本地黑名单文件不存在")
                 return False
             
@@ -113,23 +327,27 @@ class CountryBasedProxyManager:
             meta_info = self._load_blacklist_meta()
             
             # 读取黑名单内容
-            with open(self.blacklist_cache_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+            with open(self.blacklist_cache_file, 'rb') as f:
+                raw = f.read()
+            
+            # 文本未变化时直接使用已解析的二进制缓存，跳过逐行校验
+            content_hash = hashlib.blake2b(raw).hexdigest()
+            if self._load_parsed_blacklist(content_hash):
+                self.blacklist_last_update = meta_info.get('last_update', 0)
+                logging.debug(f"📁 从解析缓存加载黑名单: {self.blacklist_size} 条有效记录")
+                return True
             
-            # 解析黑名单
+            # 解析黑名单（splitlines 同时处理 \r\n 换行）
             new_blacklist = set()
-            valid_count = 0
-            for line in content.strip().split('\n'):
-                line = line.strip()
-                if line and not line.startswith('#') and line != '':
-                    if self._validate_ip_entry(line):
-                        new_blacklist.add(line)
-                        valid_count += 1
-                    else:
-                        logging.debug(f"忽略无效IP格式: {line}")
+            counts = [0, 0]
+            for line in raw.splitlines():
+                self._ingest_line(line, new_blacklist, counts)
+            valid_count = counts[0]
             
             if new_blacklist:
-                self.ip_blacklist = new_blacklist
+                self.blacklist_size = len(new_blacklist)
+                self._build_blacklist_index(new_blacklist)
+                self._save_parsed_blacklist(content_hash)
                 self.blacklist_last_update = meta_info.get('last_update', 0)
                 logging.debug(f"📁 本地黑名单解析完成: {valid_count} 条有效记录")
                 return True
@@ -141,25 +359,119 @@ class CountryBasedProxyManager:
             logging.error(f"❌ 加载本地黑名单失败: {e}")
             return False
     
-    def _load_blacklist_meta(self) -> dict:
-        """加载黑名单元数据"""
+    def _save_parsed_blacklist(self, content_hash: str):
+        """将已解析的黑名单索引保存为二进制缓存（以原始文本的哈希为键）"""
         try:
-            if os.path.exists(self.blacklist_meta_file):
-                with open(self.blacklist_meta_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            v4_starts, v4_ends = self._v4_ranges
+            v6_starts, v6_ends = self._v6_ranges
+            blobs = {
+                'v4_singles': array(_V4_TYPECODE, self._v4_singles).tobytes(),
+                'v4_starts': v4_starts.tobytes(),
+                'v4_ends': v4_ends.tobytes(),
+                'v6_singles': _pack_u128(self._v6_singles),
+                'v6_starts': _pack_u128(v6_starts),
+                'v6_ends': _pack_u128(v6_ends),
+            }
+            header = _dump_json({
+                'hash': content_hash,
+                'count': self.blacklist_size,
+                'typecode': _V4_TYPECODE,
+                'byteorder': sys.byteorder,
+                'lengths': [len(blobs[name]) for name in _PARSED_SECTIONS],
+            })
+            with open(self.blacklist_parsed_file, 'wb') as f:
+                f.write(_PARSED_HEADER_LEN.pack(len(header)))
+                f.write(header)
+                for name in _PARSED_SECTIONS:
+                    f.write(blobs[name])
+        except Exception as e:
+            logging.debug(f"保存黑名单解析缓存失败: {e}")
+    
+    def _load_parsed_blacklist(self, content_hash: str) -> bool:
+        """加载二进制缓存，哈希与当前文本一致时直接恢复索引"""
+        try:
+            if not os.path.exists(self.blacklist_parsed_file):
+                return False
+            
+            with open(self.blacklist_parsed_file, 'rb') as f:
+                raw = f.read()
+            
+            header_len = _PARSED_HEADER_LEN.unpack_from(raw)[0]
+            offset = _PARSED_HEADER_LEN.size + header_len
+            header = _load_json(raw[_PARSED_HEADER_LEN.size:offset])
+            lengths = header.get('lengths')
+            count = header.get('count')
+            
+            # 数组按本机类型码和字节序序列化，不一致或长度不符的缓存无法直接恢复，重新解析
+            if (header.get('hash') != content_hash or header.get('typecode') != _V4_TYPECODE
+                    or header.get('byteorder') != sys.byteorder
+                    or not isinstance(lengths, list) or len(lengths) != len(_PARSED_SECTIONS)
+                    or offset + sum(lengths) != len(raw)
+                    or not isinstance(count, int) or count <= 0):
+                return False
+            
+            blobs = {}
+            for name, length in zip(_PARSED_SECTIONS, lengths):
+                blobs[name] = raw[offset:offset + length]
+                offset += length
+            
+            v4_arrays = {}
+            for name in ('v4_singles', 'v4_starts', 'v4_ends'):
+                v4_arrays[name] = array(_V4_TYPECODE)
+                v4_arrays[name].frombytes(blobs[name])
+            
+            # 只恢复整数索引和条目数，不再把条目文本解析回字符串集合
+            self.blacklist_size = count
+            self._v4_singles = set(v4_arrays['v4_singles'])
+            self._v6_singles = set(_unpack_u128(blobs['v6_singles']))
+            self._v4_ranges = (v4_arrays['v4_starts'], v4_arrays['v4_ends'])
+            self._v6_ranges = (_unpack_u128(blobs['v6_starts']), _unpack_u128(blobs['v6_ends']))
+            self._is_ip_blacklisted_impl = lru_cache(maxsize=4096)(self._lookup_blacklisted_ip)
+            return True
+        
         except Exception as e:
-            logging.debug(f"加载黑名单元数据失败: {e}")
+            logging.debug(f"加载黑名单解析缓存失败: {e}")
+            return False
+    
+    def _load_blacklist_meta(self) -> dict:
+        """加载黑名单元数据（文件未变化时直接返回内存缓存）"""
+        try:
+            mtime = os.stat(self.blacklist_meta_file).st_mtime
+        except OSError:
+            self._meta_cache, self._meta_mtime = {}, None
+            return {}
         
-        return {}
+        if mtime != self._meta_mtime:
+            try:
+                with open(self.blacklist_meta_file, 'rb') as f:
+                    self._meta_cache = _load_json(f.read())
+                self._meta_mtime = mtime
+            except Exception as e:
+                logging.debug(f"加载黑名单元数据失败: {e}")
+                return {}
+        
+        return dict(self._meta_cache)
     
     def _save_blacklist_meta(self, meta_info: dict):
         """保存黑名单元数据"""
         try:
-            with open(self.blacklist_meta_file, 'w', encoding='utf-8') as f:
-                json.dump(meta_info, f, indent=2, ensure_ascii=False)
+            with open(self.blacklist_meta_file, 'wb') as f:
+                f.write(_dump_json(meta_info))
+            self._meta_cache = dict(meta_info)
+            self._meta_mtime = os.stat(self.blacklist_meta_file).st_mtime
         except Exception as e:
             logging.error(f"❌ 保存黑名单元数据失败: {e}")
     
+    @property
+    def blacklist_last_update(self) -> float:
+        return self._blacklist_last_update
+    
+    @blacklist_last_update.setter
+    def blacklist_last_update(self, value: float):
+        # 时间戳变化时预先格式化，统计接口无需每次调用 datetime
+        self._blacklist_last_update = value
+        self._last_update_iso = datetime.fromtimestamp(value).isoformat() if value else None
+    
     def _should_update_blacklist(self) -> bool:
         """检查是否需要更新黑名单"""
         if self.blacklist_last_update == 0:
@@ -177,12 +489,16 @@ class CountryBasedProxyManager:
                 return False
             
             logging.info(f"📥 正在同步下载黑名单: {self.blacklist_url}")
-            response = requests.get(self.blacklist_url, timeout=30)
+            response = requests.get(self.blacklist_url, headers=self._conditional_headers(), timeout=30)
             
-            if response.status_code == 200:
+            if response.status_code == 304:
+                return self._mark_blacklist_unchanged('remote_sync')
+            elif response.status_code == 200:
                 content = response.text
                 if content.strip():
-                    return self._save_blacklist_content(content, 'remote_sync')
+                    return self._save_blacklist_content(
+                        content, 'remote_sync', self._response_validators(response.headers)
+                    )
                 else:
                     logging.warning("⚠️ 下载的黑名单内容为空")
                     return False
@@ -194,60 +510,311 @@ class CountryBasedProxyManager:
             logging.error(f"❌ 同步下载黑名单异常: {e}")
             return False
     
-    async def _background_update_blacklist(self):
-        """后台异步更新黑名单"""
+    def _conditional_headers(self) -> dict:
+        """根据上次下载记录的 ETag / Last-Modified 构造条件请求头，内容未变时服务器返回 304"""
+        if not self.blacklist_loaded or not self._cache_file_present:
+            return {}
+        
+        meta_info = self._load_blacklist_meta()
+        headers = {}
+        if meta_info.get('etag'):
+            headers['If-None-Match'] = meta_info['etag']
+        if meta_info.get('last_modified'):
+            headers['If-Modified-Since'] = meta_info['last_modified']
+        return headers
+    
+    @staticmethod
+    def _response_validators(headers) -> dict:
+        """提取响应中的缓存校验字段，随元数据保存"""
+        return {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified')
+        }
+    
+    def _mark_blacklist_unchanged(self, source: str) -> bool:
+        """远程黑名单未变化（304）：只刷新更新时间，跳过下载和解析"""
+        current_time = time.time()
+        meta_info = self._load_blacklist_meta()
+        meta_info.update({
+            'last_update': current_time,
+            'update_time': datetime.now().isoformat(),
+            'source': source
+        })
+        self._save_blacklist_meta(meta_info)
+        self.blacklist_last_update = current_time
+        logging.info(f"✅ 远程黑名单未变化 (304)，沿用本地 {self.blacklist_size} 条记录")
+        return True
+    
+    async def _ensure_sessions(self):
+        """懒加载共享的 aiohttp 会话，保持长连接避免每次请求重新握手"""
+        if self._blacklist_session is None or self._blacklist_session.closed:
+            self._blacklist_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100, limit_per_host=10, keepalive_timeout=75,
+                    ttl_dns_cache=300, enable_cleanup_closed=True
+                ),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._blacklist_session
+    
+    def _acquire_proxy_session(self, proxy_url: str) -> tuple[_ProxySession, list]:
+        """取得（必要时创建）代理会话并登记一个使用者，返回 (会话条目, 现在可以关闭的已淘汰会话)
+        
+        整个过程没有 await：并发检测同一代理时不会各自创建会话而互相覆盖
+        """
+        now = time.time()
+        to_close = []
+        entry = self._proxy_sessions.pop(proxy_url, None)
+        if entry is not None and (entry.session.closed or now - entry.created >= self.PROXY_SESSION_REUSE):
+            to_close += entry.retire()
+            entry = None
+        
+        if entry is None:
+            to_close += self._pop_stale_proxy_sessions(now)
+            while len(self._proxy_sessions) >= self.PROXY_SESSION_LIMIT:
+                to_close += self._proxy_sessions.pop(next(iter(self._proxy_sessions))).retire()
+            
+            connector = ProxyConnector.from_url(proxy_url, limit=4, keepalive_timeout=60)
+            entry = _ProxySession(aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ), now)
+        
+        # 重新插入到末尾，字典顺序即最近使用顺序
+        self._proxy_sessions[proxy_url] = entry
+        entry.users += 1
+        return entry, to_close
+    
+    @contextlib.asynccontextmanager
+    async def _use_proxy_session(self, proxy_url: str):
+        """使用经指定代理的会话（短时间内复用已建立的连接池）；会话在使用期间被淘汰时，用完后再关闭"""
+        entry, to_close = self._acquire_proxy_session(proxy_url)
+        try:
+            await self._close_sessions(to_close)
+            yield entry.session
+        finally:
+            entry.users -= 1
+            if entry.retired and entry.users == 0:
+                await entry.session.close()
+    
+    async def query_ipinfo(self, proxy_url: str) -> Optional[dict]:
+        """经指定代理查询ipinfo.io，复用该代理的缓存会话"""
+        async with self._use_proxy_session(proxy_url) as session:
+            return await fetch_ipinfo(proxy_url, session)
+    
+    def _pop_stale_proxy_sessions(self, now: float) -> list:
+        """移除超过最大存活时间的代理会话，返回其中现在就可以关闭的（仍在使用的由使用者用完后关闭）"""
+        stale = [url for url, entry in self._proxy_sessions.items()
+                 if now - entry.created >= self.PROXY_SESSION_MAX_AGE]
+        to_close = []
+        for url in stale:
+            to_close += self._proxy_sessions.pop(url).retire()
+        return to_close
+    
+    @staticmethod
+    async def _close_sessions(sessions):
+        for session in sessions:
+            await session.close()
+    
+    async def aclose(self):
+        """关闭共享的 HTTP 会话"""
+        if self._blacklist_session is not None:
+            session, self._blacklist_session = self._blacklist_session, None
+            await session.close()
+        
+        # 关闭时不再等待使用者，直接关闭全部会话
+        sessions = [entry.session for entry in self._proxy_sessions.values()]
+        self._proxy_sessions.clear()
+        await self._close_sessions(sessions)
+    
+    async def _background_update_blacklist(self) -> bool:
+        """后台异步更新黑名单，返回是否成功"""
         try:
             if not self.blacklist_url:
-                return
+                return False
             
             logging.info(f"🔄 开始后台更新黑名单: {self.blacklist_url}")
             
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-                async with session.get(self.blacklist_url) as response:
-                    if response.status == 200:
-                        content = await response.text()
-                        if content.strip():
-                            if self._save_blacklist_content(content, 'remote_async'):
-                                logging.info("✅ 后台黑名单更新成功")
-                                self.stats['blacklist_source'] = 'remote'
-                            else:
-                                logging.error("❌ 后台黑名单保存失败")
-                        else:
-                            logging.warning("⚠️ 后台下载的黑名单内容为空")
-                    else:
-                        logging.error(f"❌ 后台黑名单下载失败，状态码: {response.status}")
+            session = await self._ensure_sessions()
+            async with session.get(self.blacklist_url, headers=self._conditional_headers()) as response:
+                if response.status == 304:
+                    await asyncio.to_thread(self._mark_blacklist_unchanged, 'remote_async')
+                    self.stats['blacklist_source'] = 'remote'
+                    return True
+                elif response.status == 200:
+                    if await self._stream_blacklist_response(response, 'remote_async'):
+                        logging.info("✅ 后台黑名单更新成功")
+                        self.stats['blacklist_source'] = 'remote'
+                        return True
+                    logging.error("❌ 后台黑名单保存失败")
+                else:
+                    logging.error(f"❌ 后台黑名单下载失败，状态码: {response.status}")
+                return False
         
         except asyncio.CancelledError:
             logging.info("🛑 后台黑名单更新被取消")
+            return False
         except Exception as e:
             logging.error(f"❌ 后台更新黑名单异常: {e}")
+            return False
     
-    def _save_blacklist_content(self, content: str, source: str) -> bool:
+    async def _stream_blacklist_response(self, response, source: str) -> bool:
+        """下载黑名单：数据块到达后经有界队列交给工作线程，写文件、切分、校验与下载同时进行"""
+        chunks = queue.Queue(maxsize=self.BLACKLIST_QUEUE_CHUNKS)
+        stop = threading.Event()  # 任一方出错时通知另一方提前结束
+        worker = asyncio.ensure_future(asyncio.to_thread(
+            self._store_downloaded_blacklist, chunks, stop, source, self._response_validators(response.headers)
+        ))
+        
+        try:
+            # iter_any 在数据到达时立即返回，不等待凑满固定大小的块
+            async for chunk in response.content.iter_any():
+                if stop.is_set():
+                    break
+                try:
+                    chunks.put_nowait(chunk)
+                except queue.Full:
+                    # 解析跟不上下载：在线程里等待队列腾出空间，不阻塞事件循环
+                    await asyncio.to_thread(chunks.put, chunk)
+        except asyncio.CancelledError:
+            stop.set()
+            self._end_chunk_queue(chunks)
+            raise
+        except Exception as e:
+            logging.error(f"❌ 下载黑名单内容失败: {e}")
+            stop.set()
+            self._end_chunk_queue(chunks)
+            await worker
+            return False
+        
+        await asyncio.to_thread(chunks.put, None)
+        return await worker
+    
+    @staticmethod
+    def _end_chunk_queue(chunks: queue.Queue):
+        """丢弃尚未处理的数据块并放入结束标记（不阻塞）"""
+        with contextlib.suppress(queue.Empty):
+            while True:
+                chunks.get_nowait()
+        with contextlib.suppress(queue.Full):
+            chunks.put_nowait(None)
+    
+    def _store_downloaded_blacklist(self, chunks: queue.Queue, stop: threading.Event,
+                                    source: str, validators: dict) -> bool:
+        """（线程中执行）从队列逐块写入临时文件并逐行校验，下载完成后替换本地文件并提交新黑名单"""
+        new_blacklist = set()
+        counts = [0, 0]  # 有效条数, 无效条数
+        hasher = hashlib.blake2b()
+        tmp_file = None
+        finished = False
+        
+        try:
+            carry = bytearray()  # 上一块末尾不完整的行
+            # 每次下载写入独立的临时文件，完成后原子替换
+            fd, tmp_file = self._mkstemp_blacklist()
+            with os.fdopen(fd, 'wb') as f:
+                while (chunk := chunks.get()) is not None and not stop.is_set():
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    
+                    # 只切分当前块，上一块的残行拼到第一行前面
+                    lines = chunk.split(b'\n')
+                    carry += lines[0]
+                    if len(lines) > 1:
+                        self._ingest_line(carry, new_blacklist, counts)
+                        for line in lines[1:-1]:
+                            self._ingest_line(line, new_blacklist, counts)
+                        carry = bytearray(lines[-1])
+                
+                finished = chunk is None
+                if carry:
+                    self._ingest_line(carry, new_blacklist, counts)
+            
+            if stop.is_set():
+                # 下载中途失败或被取消
+                os.remove(tmp_file)
+                return False
+            
+            if not new_blacklist:
+                logging.warning("⚠️ 后台下载的黑名单内容为空或无效")
+                os.remove(tmp_file)
+                return False
+            
+            os.replace(tmp_file, self.blacklist_cache_file)
+        
+        except Exception as e:
+            logging.error(f"❌ 保存黑名单内容失败: {e}")
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            if not finished:
+                # 通知下载方停止，并取走剩余数据块直到结束标记，避免下载方阻塞在满队列上
+                stop.set()
+                with contextlib.suppress(queue.Empty):
+                    while chunks.get(timeout=self.timeout) is not None:
+                        pass
+            return False
+        
+        return self._commit_blacklist(
+            new_blacklist, counts[0], counts[1], source, hasher.hexdigest(), validators
+        )
+    
+    def _mkstemp_blacklist(self) -> tuple[int, str]:
+        """在缓存目录中创建唯一的临时文件，返回 (文件描述符, 路径)"""
+        return tempfile.mkstemp(dir=self.blacklist_cache_dir, prefix='ip_blacklist.', suffix='.tmp')
+    
+    def _ingest_line(self, line: bytes, entries: Set[str], counts: list):
+        """校验单行黑名单条目并加入集合"""
+        # 先在 bytes 上判断空行和注释，只有候选条目才解码
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            return
+        entry = line.decode('utf-8', 'replace')
+        
+        if self._validate_ip_entry(entry):
+            entries.add(entry)
+            counts[0] += 1
+        else:
+            counts[1] += 1
+            logging.debug("忽略无效黑名单条目: %s", entry)
+    
+    def _save_blacklist_content(self, content: str, source: str,
+                                validators: Optional[dict] = None) -> bool:
         """保存黑名单内容到本地"""
         try:
             # 解析并验证内容
             new_blacklist = set()
-            valid_count = 0
-            invalid_count = 0
-            
-            for line in content.strip().split('\n'):
-                line = line.strip()
-                if line and not line.startswith('#') and line != '':
-                    if self._validate_ip_entry(line):
-                        new_blacklist.add(line)
-                        valid_count += 1
-                    else:
-                        invalid_count += 1
-                        logging.debug(f"忽略无效黑名单条目: {line}")
+            counts = [0, 0]
+            raw = content.encode('utf-8')
+            
+            for line in raw.splitlines():
+                self._ingest_line(line, new_blacklist, counts)
             
             if not new_blacklist:
                 logging.warning("⚠️ 解析后的黑名单内容为空")
                 return False
             
-            # 保存原始内容到本地文件
-            with open(self.blacklist_cache_file, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # 保存原始内容到本地文件（先写独立的临时文件再原子替换）
+            fd, tmp_file = self._mkstemp_blacklist()
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(raw)
+                os.replace(tmp_file, self.blacklist_cache_file)
+            except BaseException:
+                os.remove(tmp_file)
+                raise
             
+            return self._commit_blacklist(
+                new_blacklist, counts[0], counts[1], source, hashlib.blake2b(raw).hexdigest(), validators
+            )
+        
+        except Exception as e:
+            logging.error(f"❌ 保存黑名单内容失败: {e}")
+            return False
+    
+    def _commit_blacklist(self, new_blacklist: Set[str], valid_count: int, invalid_count: int,
+                          source: str, content_hash: str, validators: Optional[dict] = None) -> bool:
+        """黑名单文本已落盘后：保存元数据、更新内存索引并写入解析缓存"""
+        try:
             # 保存元数据
             current_time = time.time()
             meta_info = {
@@ -256,13 +823,17 @@ class CountryBasedProxyManager:
                 'valid_count': valid_count,
                 'invalid_count': invalid_count,
                 'update_time': datetime.now().isoformat(),
-                'url': self.blacklist_url
+                'url': self.blacklist_url,
+                **(validators or {})
             }
             self._save_blacklist_meta(meta_info)
             
             # 更新内存中的黑名单
-            old_size = len(self.ip_blacklist)
-            self.ip_blacklist = new_blacklist
+            old_size = self.blacklist_size
+            self.blacklist_size = len(new_blacklist)
+            self._cache_file_present = True
+            self._build_blacklist_index(new_blacklist)
+            self._save_parsed_blacklist(content_hash)
             self.blacklist_last_update = current_time
             self.blacklist_loaded = True
             
@@ -277,6 +848,45 @@ class CountryBasedProxyManager:
             logging.error(f"❌ 保存黑名单内容失败: {e}")
             return False
     
+    def _build_blacklist_index(self, entries: Set[str]):
+        """构建黑名单查找索引：IPv4单IP存为整数集合，网段预先解析"""
+        v4_entries = []
+        v6_singles = set()
+        v4_ranges = []
+        v6_ranges = []
+        
+        for entry in entries:
+            if '/' in entry:
+                # /32 与 /128 只是单个地址，放入哈希集合走 O(1) 查找
+                addr, _, prefix = entry.partition('/')
+                if ':' in addr:
+                    if prefix == '128':
+                        v6_singles.add(_ipv6_int(addr))
+                        continue
+                elif prefix == '32':
+                    v4_entries.append(addr)
+                    continue
+                
+                version, start, end = _cidr_range(entry)
+                ranges = v4_ranges if version == 4 else v6_ranges
+                ranges.append((start, end))
+            elif ':' in entry:
+                v6_singles.add(_ipv6_int(entry))
+            else:
+                v4_entries.append(entry)
+        
+        # 重叠网段合并为最小区间集合，已被网段覆盖的单IP一并剔除
+        v4_starts, v4_ends = _merge_ranges(v4_ranges)
+        v6_starts, v6_ends = _merge_ranges(v6_ranges)
+        
+        self._v4_singles = _prune_covered(_ipv4_int_set(v4_entries), v4_starts, v4_ends)
+        self._v6_singles = _prune_covered(v6_singles, v6_starts, v6_ends)
+        self._v4_ranges = (array(_V4_TYPECODE, v4_starts), array(_V4_TYPECODE, v4_ends))
+        self._v6_ranges = (v6_starts, v6_ends)
+        
+        # 索引发布后再换新缓存，旧结果不会混入
+        self._is_ip_blacklisted_impl = lru_cache(maxsize=4096)(self._lookup_blacklisted_ip)
+    
     def _validate_ip_entry(self, entry: str) -> bool:
         """验证IP条目格式"""
         if not entry or entry.startswith('#'):
@@ -284,13 +894,16 @@ class CountryBasedProxyManager:
         
         try:
             if '/' in entry:
-                # IP网段
-                ipaddress.ip_network(entry, strict=False)
+                # IP网段（解析结果缓存，建索引时直接复用）
+                _cidr_range(entry)
             else:
-                # 单个IP
-                ipaddress.ip_address(entry)
+                # 单个IP：直接用 inet_pton 校验，不构造 ipaddress 对象
+                try:
+                    socket.inet_pton(socket.AF_INET, entry)
+                except OSError:
+                    socket.inet_pton(socket.AF_INET6, entry)
             return True
-        except ValueError:
+        except (ValueError, OSError):
             return False
     
     async def update_ip_blacklist(self) -> bool:
@@ -301,65 +914,80 @@ class CountryBasedProxyManager:
         
         if self._should_update_blacklist():
             logging.info("🔄 手动触发黑名单更新...")
-            await self._background_update_blacklist()
-            return True
+            # 与其他入口共用同一个下载任务；调用方被取消时不影响下载本身
+            return await asyncio.shield(self._start_blacklist_update())
         else:
             hours_since_update = (time.time() - self.blacklist_last_update) / 3600
             logging.info(f"⏭️ 黑名单无需更新，距离上次更新仅 {hours_since_update:.1f} 小时")
             return True
     
     def is_ip_blacklisted(self, ip: str) -> bool:
-        """检查IP是否在黑名单中"""
+        """检查IP是否在黑名单中（结果按IP缓存）"""
         if not self.enable_blacklist or not self.blacklist_loaded:
             return False
         
+        return self._is_ip_blacklisted_impl(ip)
+    
+    def _lookup_blacklisted_ip(self, ip: str) -> bool:
+        """在黑名单索引中查找IP（未缓存的实际查找逻辑）"""
         try:
-            ip_obj = ipaddress.ip_address(ip)
+            # 只解析一次，之后全部用整数比较
+            ip_int = _ipv4_int(ip)
+            if ip_int is not None:
+                if ip_int in self._v4_singles:
+                    logging.debug("🚫 IP %s 在黑名单中", ip)
+                    return True
+                starts, ends = self._v4_ranges
+            else:
+                ip_int = _ipv6_int(ip)
+                if ip_int in self._v6_singles:
+                    logging.debug("🚫 IP %s 在黑名单中", ip)
+                    return True
+                starts, ends = self._v6_ranges
             
-            for blacklist_entry in self.ip_blacklist:
-                try:
-                    if '/' in blacklist_entry:
-                        # IP网段检查
-                        network = ipaddress.ip_network(blacklist_entry, strict=False)
-                        if ip_obj in network:
-                            logging.debug(f"🚫 IP {ip} 匹配黑名单网段: {blacklist_entry}")
-                            return True
-                    elif ip == blacklist_entry:
-                        # 单个IP检查
-                        logging.debug(f"🚫 IP {ip} 在黑名单中")
-                        return True
-                except ValueError:
-                    continue
+            # 区间互不重叠：找到起始地址不大于 ip 的最后一个区间，判断是否覆盖 ip
+            idx = bisect_right(starts, ip_int) - 1
+            if idx >= 0 and ip_int <= ends[idx]:
+                logging.debug("🚫 IP %s 匹配黑名单网段区间 #%d", ip, idx)
+                return True
             
             return False
             
-        except ValueError:
-            logging.debug(f"⚠️ 无效IP地址格式: {ip}")
+        except (ValueError, OSError):
+            logging.debug("⚠️ 无效IP地址格式: %s", ip)
             return False
     
-    def get_blacklist_stats(self) -> dict:
-        """获取黑名单详细统计信息"""
-        meta_info = self._load_blacklist_meta()
-        
-        return {
+    def get_blacklist_stats(self, include_meta: bool = True) -> dict:
+        """获取黑名单详细统计信息（include_meta=False 时不访问磁盘）"""
+        stats = {
             'enabled': self.enable_blacklist,
             'loaded': self.blacklist_loaded,
-            'size': len(self.ip_blacklist),
-            'last_update': datetime.fromtimestamp(self.blacklist_last_update).isoformat() if self.blacklist_last_update else None,
+            'size': self.blacklist_size,
+            'last_update': self._last_update_iso,
             'source': self.stats['blacklist_source'],
-            'cache_file_exists': os.path.exists(self.blacklist_cache_file),
-            'meta_file_exists': os.path.exists(self.blacklist_meta_file),
             'hours_since_update': (time.time() - self.blacklist_last_update) / 3600 if self.blacklist_last_update else 0,
             'needs_update': self._should_update_blacklist(),
             'update_interval_hours': self.blacklist_update_interval / 3600,
             'url': self.blacklist_url,
-            'meta_info': meta_info
         }
+        
+        if include_meta:
+            stats['meta_info'] = self._load_blacklist_meta()
+            stats['cache_file_exists'] = self._cache_file_present
+            stats['meta_file_exists'] = self._meta_mtime is not None
+        
+        return stats
     
     def force_update_blacklist(self):
-        """强制更新黑名单（重置更新时间）"""
+        """强制更新黑名单（重置更新时间）；下载走共用任务，完成后再唤醒监控用新黑名单复查当前代理"""
         self.blacklist_last_update = 0
-        return asyncio.create_task(self._background_update_blacklist())
+        task = self._start_blacklist_update()
+        task.add_done_callback(self._wake_after_forced_update)
+        return task
+    
+    def _wake_after_forced_update(self, task: asyncio.Task):
+        self._last_check_ts = float('-inf')  # 强制刷新后的检测不参与合并
+        self._wake_event.set()
     
     # ===== 保持原有的其他方法不变 =====
     
@@ -367,7 +995,49 @@ class CountryBasedProxyManager:
         """获取代理的真实落地IP国家"""
         if not proxy:
             return None
-            
+        
+        landing = await self._get_landing(proxy)
+        return self._apply_blacklist(*landing) if landing else None
+    
+    def _apply_blacklist(self, ip: str, country: str) -> str:
+        """落地IP在黑名单中时返回 'BLACKLISTED'，否则返回国家"""
+        # 国家不符时无论如何都要切换，无需检查黑名单
+        if country == self.target_country and self.is_ip_blacklisted(ip):
+            logging.warning(f"🚫 落地IP {ip} 在黑名单中，国家: {country}")
+            self.stats['blacklist_hits'] += 1
+            return 'BLACKLISTED'
+        return country
+    
+    async def _get_landing(self, proxy: str) -> Optional[tuple[str, str]]:
+        """获取代理的 (落地IP, 国家)，优先使用缓存；不做黑名单判断"""
+        cached = self._country_cache.get(proxy)
+        if cached and cached[2] > time.time():
+            ip, country, _ = cached
+            if ip is None:
+                # 负缓存：刚刚检测失败，短时间内不重复请求
+                return None
+            return ip, country
+        
+        landing = await self._probe_landing(proxy)
+        if landing is None:
+            self._cache_landing(proxy, None, None, self.COUNTRY_NEGATIVE_TTL)
+        return landing
+    
+    def _cache_landing(self, proxy: str, ip: Optional[str], country: Optional[str], ttl: float):
+        """写入国家检测缓存；条目数超过 COUNTRY_CACHE_MAX 时先删除过期条目，仍超出则淘汰最早写入的"""
+        now = time.time()
+        cache = self._country_cache
+        cache.pop(proxy, None)  # 重新插入到末尾，字典顺序即写入顺序
+        cache[proxy] = (ip, country, now + ttl)
+        
+        if len(cache) > self.COUNTRY_CACHE_MAX:
+            for key in [key for key, entry in cache.items() if entry[2] <= now]:
+                del cache[key]
+            while len(cache) > self.COUNTRY_CACHE_MAX:
+                del cache[next(iter(cache))]
+    
+    async def _probe_landing(self, proxy: str) -> Optional[tuple[str, str]]:
+        """实际经代理请求ipinfo.io检测落地IP和国家，成功时写入缓存"""
         try:
             # 解析代理地址
             if '://' in proxy:
@@ -383,38 +1053,27 @@ class CountryBasedProxyManager:
                 proxy_host, proxy_port = proxy_parts.split(':', 1)
                 username = password = None
             
-            # 构造curl命令的代理参数
+            # 构造SOCKS5代理URL
             if username and password:
                 proxy_url = f"socks5://{username}:{password}@{proxy_host}:{proxy_port}"
             else:
                 proxy_url = f"socks5://{proxy_host}:{proxy_port}"
             
-            # 使用aiohttp通过代理请求ipinfo.io
-            connector = aiohttp.SocksConnector.from_url(proxy_url)
-            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            # 使用aiohttp通过代理请求ipinfo.io（会话按代理缓存，连续检测复用 SOCKS/TLS 连接）
+            data = await self.query_ipinfo(proxy_url)
+            if data is None:
+                return None
             
-            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-                async with session.get('https://ipinfo.io?token=68cdce81ca2b21') as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        country = data.get('country')
-                        ip = data.get('ip')
-                        
-                        if country and ip:
-                            # 检查IP是否在黑名单中
-                            if self.is_ip_blacklisted(ip):
-                                logging.warning(f"🚫 落地IP {ip} 在黑名单中，国家: {country}")
-                                self.stats['blacklist_hits'] += 1
-                                return 'BLACKLISTED'
-                            
-                            logging.info(f"🌐 代理 {proxy_host}:{proxy_port} 落地IP: {ip}, 国家: {country}")
-                            return country
-                        else:
-                            logging.warning(f"⚠️ ipinfo.io响应缺少country或ip字段: {data}")
-                            return None
-                    else:
-                        logging.error(f"❌ ipinfo.io请求失败，状态码: {response.status}")
-                        return None
+            country = data.get('country')
+            ip = data.get('ip')
+            
+            if country and ip:
+                self._cache_landing(proxy, ip, country, self._country_cache_ttl)
+                logging.info(f"🌐 代理 {proxy_host}:{proxy_port} 落地IP: {ip}, 国家: {country}")
+                return ip, country
+            else:
+                logging.warning(f"⚠️ ipinfo.io响应缺少country或ip字段: {data}")
+                return None
                         
         except Exception as e:
             logging.error(f"❌ 获取代理国家信息时发生错误: {e}")
@@ -427,10 +1086,13 @@ class CountryBasedProxyManager:
             
         self.stats['total_checks'] += 1
         
-        # 更新IP黑名单（如果需要）
-        await self.update_ip_blacklist()
+        # 黑名单更新（如果需要）与落地IP探测相互独立，并发执行；
+        # 黑名单判断要等更新完成后再做
+        blacklist_task = asyncio.create_task(self.update_ip_blacklist())
+        landing = await self._get_landing(proxy)
+        await blacklist_task
         
-        country = await self.get_proxy_country(proxy)
+        country = self._apply_blacklist(*landing) if landing else None
         
         if country is None:
             logging.warning("⚠️ 无法获取代理国家信息，可能是代理失效")
@@ -454,100 +1116,168 @@ class CountryBasedProxyManager:
         
         return False, country
     
+    async def _check_candidate(self, get_new_proxy_func, attempt: int) -> Optional[str]:
+        """获取一个候选代理并验证其国家，符合目标时返回该代理"""
+        new_proxy = await get_new_proxy_func()
+        if not new_proxy:
+            return None
+        
+        new_country = await self.get_proxy_country(new_proxy)
+        if new_country == self.target_country:
+            return new_proxy
+        elif new_country == 'BLACKLISTED':
+            logging.warning(f"⚠️ 候选代理IP在黑名单中 ({attempt}/{self.max_retries})")
+        else:
+            logging.warning(f"⚠️ 候选代理国家 {new_country} 不符合目标 {self.target_country} ({attempt}/{self.max_retries})")
+        return None
+    
+    async def _find_compliant_proxy(self, get_new_proxy_func) -> Optional[str]:
+        """同时验证 max_retries 个候选代理，返回最先通过的一个并取消其余任务"""
+        tasks = [
+            asyncio.create_task(self._check_candidate(get_new_proxy_func, attempt))
+            for attempt in range(1, self.max_retries + 1)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    new_proxy = await next_done
+                except Exception as e:
+                    logging.error(f"❌ 获取新代理时发生错误: {e}")
+                    continue
+                if new_proxy:
+                    return new_proxy
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+    
     async def start_monitoring(self, get_new_proxy_func, switch_proxy_func):
         """开始监控代理国家变化"""
         self.is_monitoring = True
+        self._stop_event.clear()
+        
+        if self.pending_startup_update:
+            self.pending_startup_update = False
+            logging.info("⏰ 执行初始化时推迟的黑名单后台更新...")
+            self._schedule_background_update()
+        
         logging.info(f"🌍 开始监控代理国家变化，目标国家: {self.target_country}, 检测间隔: {self.check_interval}秒")
         
-        while self.is_monitoring:
+        while not self._stop_event.is_set():
             try:
+                # 同一代理刚检测过（不到半个间隔）时推迟到本轮间隔结束，合并重复触发
+                elapsed = time.monotonic() - self._last_check_ts
+                if self.current_proxy == self._last_checked_proxy and elapsed < self._cur_interval * 0.5:
+                    await self._wait_next_check(self._cur_interval - elapsed)
+                    continue
+                
                 if self.current_proxy:
                     should_switch, detected_country = await self.check_proxy_country_change(self.current_proxy)
+                    self._last_checked_proxy = self.current_proxy
+                    self._last_check_ts = time.monotonic()
+                    self._adapt_interval(should_switch)
                     
                     if should_switch:
                         logging.info("🔄 触发代理切换...")
                         self.stats['proxy_switches'] += 1
                         
-                        # 获取新代理
-                        retries = 0
-                        new_proxy = None
-                        
-                        while retries < self.max_retries:
-                            try:
-                                new_proxy = await get_new_proxy_func()
-                                if new_proxy:
-                                    # 验证新代理的国家
-                                    new_country = await self.get_proxy_country(new_proxy)
-                                    if new_country == self.target_country:
-                                        break
-                                    elif new_country == 'BLACKLISTED':
-                                        logging.warning(f"⚠️ 新代理IP在黑名单中，重试获取 ({retries + 1}/{self.max_retries})")
-                                    else:
-                                        logging.warning(f"⚠️ 新代理国家 {new_country} 不符合目标 {self.target_country}，重试获取 ({retries + 1}/{self.max_retries})")
-                                
-                                retries += 1
-                                if retries < self.max_retries:
-                                    await asyncio.sleep(2)
-                                    
-                            except Exception as e:
-                                logging.error(f"❌ 获取新代理时发生错误: {e}")
-                                retries += 1
-                                if retries < self.max_retries:
-                                    await asyncio.sleep(2)
+                        # 并发获取并验证多个候选代理，第一个符合目标国家的胜出
+                        new_proxy = await self._find_compliant_proxy(get_new_proxy_func)
                         
                         if new_proxy:
                             old_proxy = self.current_proxy
-                            await switch_proxy_func(new_proxy)
+                            if await switch_proxy_func(new_proxy) is False:
+                                # 新代理未通过连通性检查：按异常退避后再换，避免连续切换放大代理API调用
+                                raise ConnectionError(f"新代理连通性检查失败: {new_proxy}")
                             self.current_proxy = new_proxy
                             logging.info(f"✅ 代理已切换: {old_proxy} -> {new_proxy}")
                         else:
                             logging.error(f"❌ 在 {self.max_retries} 次重试后仍无法获取符合要求的代理")
                 
                 # 等待下次检测
-                await asyncio.sleep(self.check_interval)
+                self._consecutive_errors = 0
+                await self._wait_next_check(self._cur_interval)
                 
             except Exception as e:
-                logging.error(f"❌ 监控过程中发生错误: {e}")
-                await asyncio.sleep(10)
+                # 连续异常时指数退避并加入抖动，避免上游故障期间持续冲击代理API
+                self._consecutive_errors += 1
+                delay = min(self.ERROR_BACKOFF_CAP,
+                            self.ERROR_BACKOFF_BASE * 2 ** (self._consecutive_errors - 1))
+                delay *= random.uniform(0.5, 1.5)
+                logging.error(f"❌ 监控过程中发生错误: {e}，{delay:.0f} 秒后重试")
+                await self._wait_next_check(delay)
+    
+    def _adapt_interval(self, changed: bool):
+        """根据检测结果调整下一次检测间隔：变化时减半（不低于1/4及下限），连续稳定3次以上每次加15秒（不超过4倍）"""
+        # 下限至少1秒：检测间隔很短时整除结果为0，反复减半会让监控空转
+        floor = max(self.check_interval // 4, min(self.MIN_CHECK_INTERVAL, self.check_interval), 1)
+        if changed:
+            self._cur_interval = max(floor, self._cur_interval // 2)
+            self._stable_checks = 0
+        else:
+            self._stable_checks += 1
+            if self._stable_checks > 3:
+                self._cur_interval = max(floor, min(self.check_interval * 4, self._cur_interval + 15))
+    
+    async def _wait_next_check(self, timeout: float):
+        """等待下一轮检测：超时、停止监控或强制刷新时立即返回"""
+        try:
+            await asyncio.wait_for(self._wake_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._wake_event.clear()
     
     def stop_monitoring(self):
         """停止监控"""
         self.is_monitoring = False
+        self._stop_event.set()
+        self._wake_event.set()
+        
+        # 在运行中的事件循环里异步关闭共享会话
+        try:
+            asyncio.get_running_loop().create_task(self.aclose())
+        except RuntimeError:
+            pass
+        
         logging.info("🛑 代理国家监控已停止")
     
     def set_current_proxy(self, proxy: str):
         """设置当前代理"""
         self.current_proxy = proxy
         self.current_country = None
+        self._country_cache.clear()
+        
+        # 顺带清理过期的代理会话（需在运行中的事件循环里关闭）
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        stale = self._pop_stale_proxy_sessions(time.time())
+        if stale:
+            loop.create_task(self._close_sessions(stale))
     
-    def get_stats(self) -> Dict[str, Any]:
-        """获取统计信息（增强版）"""
-        base_stats = {
+    def get_stats(self, include_meta: bool = False) -> Dict[str, Any]:
+        """获取统计信息（增强版），直接读取属性组装，常规路径不访问磁盘"""
+        enabled = self.enable_blacklist
+        last_update = self.blacklist_last_update
+        
+        stats = {
             **self.stats,
             'current_proxy': self.current_proxy,
             'current_country': self.current_country,
             'target_country': self.target_country,
-            'blacklist_size': len(self.ip_blacklist),
-            'is_monitoring': self.is_monitoring
+            'blacklist_size': self.blacklist_size,
+            'is_monitoring': self.is_monitoring,
+            'blacklist_enabled': enabled,
+            'blacklist_loaded': enabled and self.blacklist_loaded,
+            'blacklist_source': self.stats['blacklist_source'] if enabled else 'disabled',
+            'blacklist_needs_update': enabled and self._should_update_blacklist(),
+            'blacklist_hours_since_update': (time.time() - last_update) / 3600 if enabled and last_update else 0,
+            'blacklist_last_update': self._last_update_iso if enabled else None
         }
         
-        # 添加黑名单详细统计
-        if self.enable_blacklist:
-            blacklist_stats = self.get_blacklist_stats()
-            base_stats.update({
-                'blacklist_enabled': blacklist_stats['enabled'],
-                'blacklist_loaded': blacklist_stats['loaded'],
-                'blacklist_source': blacklist_stats['source'],
-                'blacklist_needs_update': blacklist_stats['needs_update'],
-                'blacklist_hours_since_update': blacklist_stats['hours_since_update']
-            })
-        else:
-            base_stats.update({
-                'blacklist_enabled': False,
-                'blacklist_loaded': False,
-                'blacklist_source': 'disabled',
-                'blacklist_needs_update': False,
-                'blacklist_hours_since_update': 0
-            })
+        if include_meta and enabled:
+            stats['blacklist_meta'] = self._load_blacklist_meta()
         
-        return base_stats
+        return stats
@@ -0,0 +1,20 @@
+"""事件循环策略：已安装时使用更快的事件循环实现"""
+
+import asyncio
+import logging
+import sys
+
+def install_event_loop_policy():
+    """安装更快的事件循环实现：优先 uvloop，Windows 下尝试 winloop，都不可用时使用标准 asyncio"""
+    try:
+        if sys.platform == 'win32':
+            import winloop as fast_loop
+        else:
+            import uvloop as fast_loop
+    except ImportError:
+        logging.info("ℹ️ 未安装 uvloop/winloop，使用标准 asyncio 事件循环")
+        return False
+    
+    asyncio.set_event_loop_policy(fast_loop.EventLoopPolicy())
+    logging.info(f"⚡ 已启用 {fast_loop.__name__} 事件循环")
+    return True
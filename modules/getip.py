@@ -4,16 +4,113 @@
 import json
 import time
 import random
+import re
+import asyncio
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
 import logging
 import os
+from collections import deque
+from functools import lru_cache
+
+try:
+    import orjson  # 可选依赖：直接从 bytes 解码，比 json 更快
+except ImportError:
+    orjson = None
+
+# 导入时确定 JSON 解析函数，两者都接受 bytes，解析失败都抛出 ValueError 子类
+json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    import h2  # httpx[http2] 附带：可用时异步客户端启用 HTTP/2 多路复用
+except ImportError:
+    h2 = None
+
+try:
+    import ijson  # 可选依赖：增量解析代理列表，只保留抽样需要的代理
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+# 白名单接口（检测到白名单错误时调用），appKey / anquanma 从 config.ini 的 whitelist_app_key / whitelist_anquanma 读取
+WHITELIST_URL_TEMPLATE = "https://sch.shanchendaili.com/api.html?action=addWhiteList&appKey={app_key}&anquanma={anquanma}"
+WHITELIST_MISSING_MESSAGE = "⚠️ config.ini 未配置 whitelist_app_key / whitelist_anquanma，跳过自动添加白名单"
+
+# newip 使用的持久同步会话（连接池复用 TCP/TLS 连接）
+_session = None
+
+# 每个线程独立的随机数生成器（并发获取代理时不争用全局 random 实例）
+_thread_local = threading.local()
+
+# 过滤后的代理列表缓存：(缓存键, 过期时间, 符合条件的代理列表)，newip 与 newip_async 共用
+_list_cache = (None, 0.0, None)
+
+# 预取代理池：[(获取时间, 代理URL)]，由后台线程补充，newip / newip_async 优先从中取用
+_prefetch_pool = deque()
+_prefetch_thread = None
+_prefetch_wanted = threading.Event()
+_prefetch_stop = threading.Event()
+
+# newip_async 使用的持久异步客户端及其所属事件循环
+_async_client = None
+_async_client_loop = None
+# 正在关闭的旧异步客户端任务（保留引用，避免任务被提前回收）
+_closing_tasks = set()
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.ini')
+
+# 预取的代理超过该时间（秒）未被使用则丢弃，避免拿到已失效的代理
+PREFETCH_MAX_AGE = 120
+# 预取失败后的重试间隔（秒）
+PREFETCH_RETRY_DELAY = 5
+
+MESSAGES = {
+    'whitelist_error': '白名单错误',
+    'proxy_file_not_found': '代理文件未找到'
+}
+
+def thread_rng():
+    """返回当前线程的 random.Random 实例（首次使用时以 os.urandom 播种）"""
+    rng = getattr(_thread_local, 'rng', None)
+    if rng is None:
+        rng = _thread_local.rng = random.Random(os.urandom(8))
+    return rng
+
+def file_mtime(path):
+    """返回文件修改时间（纳秒），文件不存在时返回 None（用作缓存键）"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 def load_config():
-    """简化的配置加载函数"""
-    import os
-    import configparser
-    
-    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.ini')
+    """简化的配置加载函数（按文件修改时间和 EXCLUDE_ISPS 环境变量缓存，未变化时不重复解析）"""
+    return dict(load_config_cached(file_mtime(CONFIG_PATH), os.getenv('EXCLUDE_ISPS')))
+
+def parse_exclude_isps(value):
+    """将逗号分隔的 ISP 关键字解析为小写元组（不可变，缓存的配置副本之间共享也不会被改动），空字符串表示禁用过滤"""
+    return tuple(isp.strip().lower() for isp in value.split(',') if isp.strip())
+
+def read_flat_config(path):
+    """逐行解析扁平的 key = value 配置文件：忽略注释、空行和 [section] 行，所有键视为全局，重复的键以最后一次为准"""
+    values = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in '#;[':
+                continue
+            key, sep, value = line.partition('=')
+            if sep:
+                values[key.strip().lower()] = value.strip()
+    return values
+
+@lru_cache(maxsize=1)
+def load_config_cached(mtime, env_exclude_isps):
+    config_path = CONFIG_PATH
     config = {
         'language': 'cn',
         'getip_url': '',
@@ -21,444 +118,674 @@ def load_config():
         'proxy_username': '',      # 备用固定认证用户名
         'proxy_password': '',      # 备用固定认证密码
         'use_api_auth': 'True',    # 优先使用API返回的认证信息
-        'fallback_to_fixed': 'True' # API无认证时是否fallback到固定认证
+        'fallback_to_fixed': 'True', # API无认证时是否fallback到固定认证
+        'exclude_isps': 'verizon,rcn', # 排除的ISP关键字
+        'list_cache_ttl': '30',    # 代理列表缓存秒数，0 表示每次都重新获取
+        'verbose_logging': 'True', # 是否输出代理筛选统计
+        'prefetch_pool_size': '0', # 后台预取的代理数量，0 表示不预取
+        'whitelist_app_key': '',   # 白名单接口 appKey
+        'whitelist_anquanma': '',  # 白名单接口安全码
+        'log_level': 'INFO'        # getip 日志级别（DEBUG/INFO/WARNING/ERROR）
     }
     
     if os.path.exists(config_path):
         try:
-            parser = configparser.ConfigParser()
-            parser.read(config_path, encoding='utf-8')
-            
-            section = 'DEFAULT' if 'DEFAULT' in parser else parser.sections()[0] if parser.sections() else 'DEFAULT'
-            
+            values = read_flat_config(config_path)
             for key in config.keys():
-                if parser.has_option(section, key):
-                    config[key] = parser.get(section, key)
+                if key in values:
+                    config[key] = values[key]
         except Exception as e:
-            logging.error(f"读取配置文件失败: {e}")
+            log.error("读取配置文件失败: %s", e)
+    
+    # 配置文件变化时同步日志级别
+    try:
+        log.setLevel(config['log_level'].strip().upper())
+    except ValueError:
+        log.warning("⚠️ 无效的 log_level: %s", config['log_level'])
+    
+    # 🔧 支持环境变量覆盖（优先级最高）
+    if env_exclude_isps:
+        config['exclude_isps'] = env_exclude_isps
+        log.info("🔧 使用环境变量EXCLUDE_ISPS: '%s'", env_exclude_isps)
+    config['exclude_isps_parsed'] = parse_exclude_isps(config['exclude_isps'])
     
     return config
 
 def get_message(key, language, *args):
     """简化的消息获取函数"""
-    messages = {
-        'whitelist_error': '白名单错误',
-        'proxy_file_not_found': '代理文件未找到'
+    return MESSAGES.get(key, key)
+
+def load_newip_settings():
+    """读取获取代理所需的配置（接口地址、认证方式、ISP过滤）；配置文件和环境变量不变时直接返回缓存结果"""
+    return dict(load_newip_settings_cached(file_mtime(CONFIG_PATH), os.getenv('EXCLUDE_ISPS')))
+
+@lru_cache(maxsize=1)
+def load_newip_settings_cached(config_mtime, env_exclude_isps):
+    config = load_config_cached(config_mtime, env_exclude_isps)
+    
+    # 配置信息
+    list_url = config.get('getip_url', '')
+    buy_url_template = config.get('buy_url_template', '')
+    
+    # 认证配置
+    fixed_username = config.get('proxy_username', '')
+    fixed_password = config.get('proxy_password', '')
+    use_api_auth = config.get('use_api_auth', 'True').lower() == 'true'
+    fallback_to_fixed = config.get('fallback_to_fixed', 'True').lower() == 'true'
+    verbose = config.get('verbose_logging', 'True').lower() == 'true'
+    
+    # 白名单接口（appKey 或安全码未配置时为空，跳过自动添加白名单）
+    whitelist_app_key = config.get('whitelist_app_key', '').strip()
+    whitelist_anquanma = config.get('whitelist_anquanma', '').strip()
+    if whitelist_app_key and whitelist_anquanma:
+        whitelist_url = WHITELIST_URL_TEMPLATE.format(app_key=whitelist_app_key, anquanma=whitelist_anquanma)
+    else:
+        whitelist_url = ''
+    
+    try:
+        list_cache_ttl = max(float(config.get('list_cache_ttl', '30')), 0.0)
+    except ValueError:
+        list_cache_ttl = 30.0
+    
+    # 🔥 ISP过滤配置（load_config 中已解析，环境变量优先）
+    exclude_isps = config['exclude_isps_parsed']
+    
+    # 显示当前的ISP过滤配置
+    if exclude_isps:
+        log.info("🔧 当前ISP过滤配置: %s", exclude_isps)
+    else:
+        log.info("🔧 ISP过滤已禁用（exclude_isps为空）")
+    
+    if not list_url:
+        raise ValueError('getip_url 配置为空，请在 config.ini 中设置 getip_url')
+    
+    return {
+        'language': config.get('language', 'cn'),
+        'list_url': list_url,
+        'buy_url_template': buy_url_template,
+        'fixed_username': fixed_username,
+        'fixed_password': fixed_password,
+        'use_api_auth': use_api_auth,
+        'fallback_to_fixed': fallback_to_fixed,
+        'exclude_isps': exclude_isps,
+        'list_cache_ttl': list_cache_ttl,
+        'verbose': verbose,
+        'whitelist_url': whitelist_url,
     }
-    return messages.get(key, key)
 
-def newip():
-    """获取新代理IP的主函数 - 支持API返回的认证信息"""
-    config = load_config()
-    language = config.get('language', 'cn')
+def parse_json_response(content, error_message):
+    """解析接口返回的 JSON 内容（直接使用原始 bytes，跳过解码为 str 的中间步骤）"""
+    try:
+        return json_loads(content)
+    except ValueError:
+        raise ValueError(error_message)
+
+@lru_cache(maxsize=8)
+def isp_exclusion_pattern(blocked):
+    """将排除的ISP关键字编译为一个忽略大小写的正则，每个 host 只需一次匹配"""
+    return re.compile('|'.join(map(re.escape, blocked)), re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def is_excluded_host(blocked, host):
+    """判断 host 是否命中排除的ISP关键字；代理列表在多次轮询间大量重复，结果按 host 缓存"""
+    return isp_exclusion_pattern(blocked).search(host) is not None
+
+def check_list_status(status):
+    """检查代理列表接口返回的状态"""
+    if status.get('code') != '1000':
+        error_msg = status.get('message', 'Unknown API error')
+        raise ValueError(f"获取代理列表API返回错误: {error_msg}")
+
+def filter_proxy_data(data, settings, keep_all=None):
+    """从代理列表响应中过滤ISP，返回符合条件的代理列表"""
+    # 检查API状态
+    check_list_status(data.get('status', {}))
     
-    def handle_error(error_type, details=None):
-        error_msg = 'whitelist_error' if error_type == 'whitelist' else 'proxy_file_not_found'
-        print(get_message(error_msg, language, str(details)))
-        raise ValueError(f"{error_type}: {details}")
+    # 获取代理列表
+    proxy_list = data.get('data', [])
     
+    if not proxy_list:
+        raise ValueError("代理列表为空")
+    
+    return filter_proxy_list(proxy_list, settings, keep_all=keep_all)
+
+def iter_proxy_list_stream(raw, status):
+    """用 ijson 增量解析代理列表响应：逐个产出 data 数组中的代理，status 字段写入传入的字典"""
+    builder = None
+    for prefix, event, value in ijson.parse(raw):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'data.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'data.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif prefix in ('status.code', 'status.message'):
+            status[prefix[7:]] = value
+
+def filter_proxy_list(proxies, settings, status=None, keep_all=None):
+    """遍历代理（列表或流式迭代器），过滤ISP后返回符合条件的代理列表；流式解析时 status 在遍历结束后检查
+    
+    keep_all 默认跟随代理列表缓存是否启用；为 False 时用蓄水池抽样只保留一个随机代理，返回单元素列表，不构建完整的过滤结果
+    """
+    exclude_isps = settings['exclude_isps']
+    if keep_all is None:
+        keep_all = settings['list_cache_ttl'] > 0
+    
+    # 🔥 简化的过滤系统：只过滤ISP（一次遍历，被排除的代理不会保留）
+    blocked = exclude_isps
+    if not blocked and isinstance(proxies, list):
+        # 未启用ISP过滤且已是完整列表：无需遍历，直接使用原列表（或随机取一个）
+        total_count = eligible_count = len(proxies)
+        eligible = proxies if keep_all or not proxies else [thread_rng().choice(proxies)]
+    else:
+        total_count = 0
+        randrange = thread_rng().randrange
+        eligible = []
+        eligible_count = 0
+        for proxy in proxies:
+            total_count += 1
+            if blocked and is_excluded_host(blocked, proxy.get('host', '')):
+                continue
+            eligible_count += 1
+            if keep_all:
+                eligible.append(proxy)
+            elif randrange(eligible_count) == 0:
+                eligible = [proxy]
+    excluded_by_isp = total_count - eligible_count
+    
+    if status is not None:
+        check_list_status(status)
+        if not total_count:
+            raise ValueError("代理列表为空")
+    
+    # 简化的过滤统计信息（一条日志输出；verbose_logging = False 或日志级别高于 INFO 时跳过）
+    if settings['verbose'] and log.isEnabledFor(logging.INFO):
+        log.info(
+            "📊 代理筛选统计:\n   总代理数量: %d\n   ISP过滤排除: %d 个\n   符合条件的代理: %d 个%s",
+            total_count, excluded_by_isp, eligible_count,
+            f"\n   排除的ISP关键字: {', '.join(exclude_isps)}" if exclude_isps else ""
+        )
+    
+    if not eligible:
+        error_msg = "过滤后的代理列表为空。"
+        if exclude_isps:
+            error_msg += f" 所有代理都包含被排除的ISP关键字: {exclude_isps}。"
+        else:
+            error_msg += " 原始代理列表为空。"
+        raise ValueError(error_msg)
+    
+    return eligible
+
+def choose_proxy_id(proxies):
+    """从符合条件的代理列表中随机选择一个ID"""
+    selected_proxy = thread_rng().choice(proxies)
+    proxy_id = selected_proxy.get('id')
+    
+    if not proxy_id:
+        raise ValueError("选中的代理缺少ID信息")
+    
+    log.info(
+        "随机选择的代理ID: %s\n代理位置: %s, %s\nHost: %s",
+        proxy_id,
+        selected_proxy.get('city', 'Unknown'),
+        selected_proxy.get('region', 'Unknown'),
+        selected_proxy.get('host', 'Unknown')
+    )
+    
+    return proxy_id
+
+def list_cache_key(settings):
+    """代理列表缓存键：接口地址或ISP过滤条件变化时缓存失效"""
+    return (settings['list_url'], settings['exclude_isps'])
+
+def cached_proxy_list(settings):
+    """返回 TTL 内缓存的过滤后代理列表，未命中或已过期时返回 None"""
+    key, expires, proxies = _list_cache
+    if key == list_cache_key(settings) and expires > time.monotonic():
+        log.info("♻️ 使用缓存的代理列表（%d 个符合条件的代理）", len(proxies))
+        return proxies
+    return None
+
+def store_proxy_list(settings, proxies):
+    """缓存过滤后的代理列表（list_cache_ttl 为 0 时不缓存），返回传入的列表"""
+    global _list_cache
+    ttl = settings['list_cache_ttl']
+    if ttl > 0:
+        _list_cache = (list_cache_key(settings), time.monotonic() + ttl, proxies)
+    return proxies
+
+def build_proxy_string(data, settings):
+    """从代理详情响应中构造最终的SOCKS5代理URL - 处理新的API格式"""
+    use_api_auth = settings['use_api_auth']
+    fallback_to_fixed = settings['fallback_to_fixed']
+    fixed_username = settings['fixed_username']
+    fixed_password = settings['fixed_password']
+    
+    # 检查API状态
+    if data.get('status', {}).get('code') != '1000':
+        error_msg = data.get('status', {}).get('message', 'Unknown API error')
+        raise ValueError(f"获取代理详情API返回错误: {error_msg}")
+    
+    # 解析代理数据
+    proxy_data = data.get('data', {})
+    
+    # 🔥 提取基本信息
+    ip = proxy_data.get('ipaddress')
+    port = proxy_data.get('port')
+    
+    if not ip or not port:
+        raise ValueError("API响应中缺少IP或端口信息")
+    
+    # 🔥 提取认证信息（支持你的新API格式）
+    api_username = proxy_data.get('username', '').strip()
+    api_password = proxy_data.get('password', '').strip()
+    
+    # 决定最终使用的认证信息
+    final_username = None
+    final_password = None
+    auth_source = "none"
+    
+    if use_api_auth and api_username and api_password:
+        # 优先使用API返回的认证信息
+        final_username = api_username
+        final_password = api_password
+        auth_source = "api"
+        log.info("✅ 使用API返回的认证信息: %s:***", api_username)
+    
+    elif fallback_to_fixed and fixed_username and fixed_password:
+        # fallback到配置的固定认证信息
+        final_username = fixed_username
+        final_password = fixed_password
+        auth_source = "fixed"
+        log.info("⚠️ API未提供认证信息，使用配置的固定认证: %s:***", fixed_username)
+    
+    else:
+        # 无认证
+        log.info("ℹ️ 使用无认证代理: %s:%s", ip, port)
+    
+    # 显示代理详细信息
+    # 只有当API确实返回了类型信息时才显示
+    proxy_type = proxy_data.get('is_type', '')
+    log.info(
+        "代理详情:\n  - IP: %s\n  - 端口: %s\n  - 位置: %s, %s\n  - ISP: %s%s\n  - 认证: %s",
+        ip, port,
+        proxy_data.get('city', 'Unknown'),
+        proxy_data.get('region', 'Unknown'),
+        proxy_data.get('host', 'Unknown'),
+        f"\n  - 类型: {proxy_type}" if proxy_type and proxy_type != 'Unknown' else "",
+        auth_source
+    )
+    
+    # 构造代理URL（一次格式化完成）
+    auth_prefix = f"{final_username}:{final_password}@" if final_username and final_password else ""
+    return f"socks5://{auth_prefix}{ip}:{port}"
+
+def handle_newip_error(error_type, details, language):
+    """输出错误提示并统一抛出 ValueError"""
+    error_msg = 'whitelist_error' if error_type == 'whitelist' else 'proxy_file_not_found'
+    log.error("%s: %s", get_message(error_msg, language), details)
+    raise ValueError(f"{error_type}: {details}")
+
+def prefetch_pool_size():
+    """读取配置的预取代理池大小（配置按修改时间缓存，开销很小）"""
     try:
-        # 配置信息
-        list_url = config.get('getip_url', '')
-        buy_url_template = config.get('buy_url_template', '')
-        
-        # 认证配置
-        fixed_username = config.get('proxy_username', '')
-        fixed_password = config.get('proxy_password', '')
-        use_api_auth = config.get('use_api_auth', 'True').lower() == 'true'
-        fallback_to_fixed = config.get('fallback_to_fixed', 'True').lower() == 'true'
-        
-        # 🔥 ISP过滤配置（使用手动解析确保正确读取）
-        
-        # 🔧 直接读取配置文件确保正确性
-        config_path = '/proxy-1/config/config.ini'
-        exclude_isps_config = 'verizon,rcn'  # 默认值
+        return max(int(load_config().get('prefetch_pool_size', '0')), 0)
+    except ValueError:
+        return 0
+
+def take_prefetched_proxy():
+    """从预取池取出一个未过期的代理并通知后台线程补充；未启用预取或池为空时返回 None"""
+    if prefetch_pool_size() <= 0:
+        return None
+    
+    start_prefetch()
+    proxy = None
+    now = time.monotonic()
+    while _prefetch_pool:
+        try:
+            fetched_at, candidate = _prefetch_pool.popleft()
+        except IndexError:
+            break
+        if now - fetched_at <= PREFETCH_MAX_AGE:
+            proxy = candidate
+            break
+    
+    _prefetch_wanted.set()
+    if proxy:
+        log.info("♻️ 使用预取的代理: %s", proxy)
+    return proxy
+
+def start_prefetch():
+    """启动后台预取线程（只启动一次）"""
+    global _prefetch_thread
+    if _prefetch_thread is None or not _prefetch_thread.is_alive():
+        _prefetch_stop.clear()
+        _prefetch_wanted.set()
+        _prefetch_thread = threading.Thread(target=prefetch_loop, name='newip-prefetch', daemon=True)
+        _prefetch_thread.start()
+
+def stop_prefetch():
+    """停止后台预取线程"""
+    _prefetch_stop.set()
+    _prefetch_wanted.set()
+
+def prefetch_loop():
+    """后台预取循环：被取用后用一次批量获取把预取池补充到配置的大小，失败时等待后重试"""
+    while not _prefetch_stop.is_set():
+        _prefetch_wanted.wait()
+        _prefetch_wanted.clear()
         
-        if os.path.exists(config_path):
+        while not _prefetch_stop.is_set():
+            missing = prefetch_pool_size() - len(_prefetch_pool)
+            if missing <= 0:
+                break
             try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                for line_num, line in enumerate(lines, 1):
-                    line_stripped = line.strip()
-                    if '=' in line_stripped and 'exclude_isps' in line_stripped:
-                        key, value = line_stripped.split('=', 1)
-                        if key.strip() == 'exclude_isps':
-                            exclude_isps_config = value.strip()
-                            print(f"🔧 直接读取exclude_isps (第{line_num}行): '{exclude_isps_config}'")
-                            break
+                proxies = newip_batch(missing)
+                if not proxies:
+                    raise ValueError("批量获取未返回可用代理")
+                now = time.monotonic()
+                _prefetch_pool.extend((now, proxy) for proxy in proxies)
             except Exception as e:
-                print(f"🔧 直接读取失败，使用配置对象: {e}")
-                exclude_isps_config = config.get('exclude_isps', 'verizon,rcn')
-        else:
-            exclude_isps_config = config.get('exclude_isps', 'verizon,rcn')
-        
-        # 🔧 支持环境变量覆盖（优先级最高）
-        env_exclude_isps = os.getenv('EXCLUDE_ISPS')
-        if env_exclude_isps:
-            exclude_isps_config = env_exclude_isps
-            print(f"🔧 使用环境变量EXCLUDE_ISPS: '{exclude_isps_config}'")
-        
-        # 处理空配置的情况
-        if exclude_isps_config.strip():
-            exclude_isps = [isp.strip().lower() for isp in exclude_isps_config.split(',') if isp.strip()]
-        else:
-            exclude_isps = []
-        
-        # 显示当前的ISP过滤配置
-        if exclude_isps:
-            print(f"🔧 当前ISP过滤配置: {exclude_isps}")
-        else:
-            print(f"🔧 ISP过滤已禁用（exclude_isps为空）")
-        
-        if not list_url:
-            raise ValueError('getip_url 配置为空，请在 config.ini 中设置 getip_url')
-        
-        def get_proxy_list():
-            """获取代理列表并随机选择一个ID"""
-            print(f"正在获取代理列表: {list_url}")
-            response = requests.get(list_url, timeout=10)
+                log.warning("⚠️ 预取代理失败: %s", e)
+                _prefetch_stop.wait(PREFETCH_RETRY_DELAY)
+
+def newip(force_refresh=False):
+    """获取新代理IP：启用预取时优先使用预取池中的代理，否则（或池为空时）同步获取"""
+    if not force_refresh:
+        proxy = take_prefetched_proxy()
+        if proxy:
+            return proxy
+    return fetch_newip(force_refresh)
+
+def fetch_proxy_candidates(settings, force_refresh=False, keep_all=None):
+    """获取过滤后的候选代理列表（TTL 内复用缓存）"""
+    if not force_refresh:
+        proxies = cached_proxy_list(settings)
+        if proxies is not None:
+            return proxies
+    
+    log.info("正在获取代理列表: %s", settings['list_url'])
+    
+    if ijson is not None:
+        # 边下载边解析，被过滤和未选中的代理不会整体保留在内存中
+        with get_session().get(settings['list_url'], timeout=10, stream=True) as response:
             response.raise_for_status()
-            
+            response.raw.decode_content = True
+            status = {}
             try:
-                data = json.loads(response.text)
-                
-                # 检查API状态
-                if data.get('status', {}).get('code') != '1000':
-                    error_msg = data.get('status', {}).get('message', 'Unknown API error')
-                    raise ValueError(f"获取代理列表API返回错误: {error_msg}")
-                
-                # 获取代理列表
-                proxy_list = data.get('data', [])
-                
-                if not proxy_list:
-                    raise ValueError("代理列表为空")
-                
-                # 🔥 简化的过滤系统：只过滤ISP
-                filtered_proxy_list = []
-                total_count = len(proxy_list)
-                excluded_by_isp = 0
-                
-                for proxy in proxy_list:
-                    host = proxy.get('host', '').lower()
-                    proxy_id = proxy.get('id', 'unknown')
-                    
-                    # 检查ISP排除列表
-                    excluded_by_current_isp = False
-                    if exclude_isps:
-                        for excluded_isp in exclude_isps:
-                            if excluded_isp and excluded_isp in host:
-                                excluded_by_isp += 1
-                                excluded_by_current_isp = True
-                                break
-                    
-                    if excluded_by_current_isp:
-                        continue
-                    
-                    filtered_proxy_list.append(proxy)
-                
-                # 简化的过滤统计信息
-                print(f"📊 代理筛选统计:")
-                print(f"   总代理数量: {total_count}")
-                print(f"   ISP过滤排除: {excluded_by_isp} 个")
-                print(f"   符合条件的代理: {len(filtered_proxy_list)} 个")
-                
-                if exclude_isps:
-                    print(f"   排除的ISP关键字: {', '.join(exclude_isps)}")
-                
-                if not filtered_proxy_list:
-                    error_msg = "过滤后的代理列表为空。"
-                    if exclude_isps:
-                        error_msg += f" 所有代理都包含被排除的ISP关键字: {exclude_isps}。"
-                    else:
-                        error_msg += " 原始代理列表为空。"
-                    raise ValueError(error_msg)
-                
-                # 从过滤后的列表中随机选择一个代理的ID
-                selected_proxy = random.choice(filtered_proxy_list)
-                proxy_id = selected_proxy.get('id')
-                
-                if not proxy_id:
-                    raise ValueError("选中的代理缺少ID信息")
-                
-                print(f"随机选择的代理ID: {proxy_id}")
-                print(f"代理位置: {selected_proxy.get('city', 'Unknown')}, {selected_proxy.get('region', 'Unknown')}")
-                print(f"Host: {selected_proxy.get('host', 'Unknown')}")
-                
-                return proxy_id
-                
-            except json.JSONDecodeError:
+                proxies = filter_proxy_list(iter_proxy_list_stream(response.raw, status), settings, status, keep_all)
+            except ijson.JSONError:
                 raise ValueError("获取代理列表API响应不是有效的JSON格式")
+    else:
+        response = get_session().get(settings['list_url'], timeout=10)
+        response.raise_for_status()
         
-        def buy_proxy(proxy_id):
-            """通过ID购买/获取具体代理信息 - 处理新的API格式"""
-            buy_url = f"{buy_url_template}{proxy_id}"
-            print(f"获取代理详情: {buy_url}")
-            
-            response = requests.get(buy_url, timeout=10)
-            response.raise_for_status()
-            
-            try:
-                data = json.loads(response.text)
-                
-                # 检查API状态
-                if data.get('status', {}).get('code') != '1000':
-                    error_msg = data.get('status', {}).get('message', 'Unknown API error')
-                    raise ValueError(f"获取代理详情API返回错误: {error_msg}")
-                
-                # 解析代理数据
-                proxy_data = data.get('data', {})
-                
-                # 🔥 提取基本信息
-                ip = proxy_data.get('ipaddress')
-                port = proxy_data.get('port')
-                
-                if not ip or not port:
-                    raise ValueError("API响应中缺少IP或端口信息")
-                
-                # 🔥 提取认证信息（支持你的新API格式）
-                api_username = proxy_data.get('username', '').strip()
-                api_password = proxy_data.get('password', '').strip()
-                
-                # 决定最终使用的认证信息
-                final_username = None
-                final_password = None
-                auth_source = "none"
-                
-                if use_api_auth and api_username and api_password:
-                    # 优先使用API返回的认证信息
-                    final_username = api_username
-                    final_password = api_password
-                    auth_source = "api"
-                    print(f"✅ 使用API返回的认证信息: {api_username}:***")
-                    
-                elif fallback_to_fixed and fixed_username and fixed_password:
-                    # fallback到配置的固定认证信息
-                    final_username = fixed_username
-                    final_password = fixed_password
-                    auth_source = "fixed"
-                    print(f"⚠️ API未提供认证信息，使用配置的固定认证: {fixed_username}:***")
-                    
-                else:
-                    # 无认证
-                    print(f"ℹ️ 使用无认证代理: {ip}:{port}")
-                
-                # 显示代理详细信息
-                print(f"代理详情:")
-                print(f"  - IP: {ip}")
-                print(f"  - 端口: {port}")
-                print(f"  - 位置: {proxy_data.get('city', 'Unknown')}, {proxy_data.get('region', 'Unknown')}")
-                print(f"  - ISP: {proxy_data.get('host', 'Unknown')}")
-                
-                # 只有当API确实返回了类型信息时才显示
-                proxy_type = proxy_data.get('is_type', '')
-                if proxy_type and proxy_type != 'Unknown':
-                    print(f"  - 类型: {proxy_type}")
-                
-                print(f"  - 认证: {auth_source}")
-                
-                # 构造代理字符串
-                if final_username and final_password:
-                    proxy_string = f"{final_username}:{final_password}@{ip}:{port}"
-                else:
-                    proxy_string = f"{ip}:{port}"
-                
-                return proxy_string
-                
-            except json.JSONDecodeError:
-                raise ValueError("获取代理详情API响应不是有效的JSON格式")
+        data = parse_json_response(response.content, "获取代理列表API响应不是有效的JSON格式")
+        proxies = filter_proxy_data(data, settings, keep_all)
+    
+    return store_proxy_list(settings, proxies)
+
+def buy_proxy(settings, proxy_id):
+    """通过ID购买/获取具体代理信息，返回SOCKS5代理URL"""
+    buy_url = f"{settings['buy_url_template']}{proxy_id}"
+    log.info("获取代理详情: %s", buy_url)
+    
+    response = get_session().get(buy_url, timeout=10)
+    response.raise_for_status()
+    
+    data = parse_json_response(response.content, "获取代理详情API响应不是有效的JSON格式")
+    return build_proxy_string(data, settings)
+
+def add_whitelist(settings):
+    """调用白名单接口添加当前IP（不读取响应体，连接立即归还连接池）"""
+    if not settings['whitelist_url']:
+        log.warning(WHITELIST_MISSING_MESSAGE)
+        return
+    with get_session().get(settings['whitelist_url'], timeout=5, stream=True) as response:
+        response.raise_for_status()
+
+def fetch_newip(force_refresh=False):
+    """获取新代理IP的主函数 - 支持API返回的认证信息；force_refresh=True 时忽略代理列表缓存"""
+    language = 'cn'
+    
+    try:
+        settings = load_newip_settings()
+        language = settings['language']
         
         # 执行获取流程
-        print("="*50)
-        print("🚀 开始获取代理...")
+        log.info("🚀 开始获取代理...")
         
         # 第一步：获取代理列表并选择ID
-        proxy_id = get_proxy_list()
+        proxy_id = choose_proxy_id(fetch_proxy_candidates(settings, force_refresh))
         
         # 第二步：通过ID获取具体代理信息
-        proxy = buy_proxy(proxy_id)
+        proxy = buy_proxy(settings, proxy_id)
         
         # 处理特殊错误代码（保留原有逻辑）
         if proxy == "error000x-13":
-            print("⚠️ 检测到白名单错误，尝试添加白名单...")
-            appKey = ""
-            anquanma = ""
-            whitelist_url = f"https://sch.shanchendaili.com/api.html?action=addWhiteList&appKey={appKey}&anquanma={anquanma}"
-            requests.get(whitelist_url).raise_for_status()
+            log.warning("⚠️ 检测到白名单错误，尝试添加白名单...")
+            add_whitelist(settings)
             time.sleep(1)
             
-            # 重新获取
-            proxy_id = get_proxy_list()
-            proxy = buy_proxy(proxy_id)
-        
-        # 🔥 构造最终的SOCKS5代理URL
-        result = f"socks5://{proxy}"
+            # 重新获取（白名单刚更新，不使用缓存的代理列表）
+            proxy_id = choose_proxy_id(fetch_proxy_candidates(settings, force_refresh=True))
+            proxy = buy_proxy(settings, proxy_id)
         
-        print("="*50)
-        print(f"✅ 代理获取成功!")
-        print(f"📋 最终代理: {result}")
-        print("="*50)
-        
-        return result
+        return finish_newip(proxy)
         
     except requests.RequestException as e:
-        handle_error('request', e)
+        handle_newip_error('request', e, language)
     except ValueError as e:
-        handle_error('config', e)
+        handle_newip_error('config', e, language)
     except Exception as e:
-        handle_error('unknown', e)
+        handle_newip_error('unknown', e, language)
 
-def debug_config():
-    """调试配置加载情况"""
-    print("🔧 调试配置加载情况:")
-    print("="*50)
-    
-    import os
-    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.ini')
-    print(f"配置文件路径: {config_path}")
-    print(f"配置文件是否存在: {os.path.exists(config_path)}")
-    
-    if os.path.exists(config_path):
-        print(f"\n配置文件内容:")
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                for i, line in enumerate(lines, 1):
-                    if 'exclude_isps' in line.lower():
-                        print(f"  第{i}行: {line.strip()} ⭐")
-                    elif line.strip() and not line.strip().startswith('#'):
-                        print(f"  第{i}行: {line.strip()}")
-        except Exception as e:
-            print(f"读取配置文件失败: {e}")
-    
-    # 🔧 使用修复后的配置加载逻辑
-    config = load_config()
-    
-    print(f"\n解析后的配置:")
-    for key, value in config.items():
-        if 'password' in key.lower():
-            print(f"  {key} = {'*' * len(str(value)) if value else '(空)'}")
-        else:
-            print(f"  {key} = {value}")
+def sample_proxy_ids(proxies, k):
+    """从候选代理中随机选出最多 k 个不重复的代理ID"""
+    ids = [proxy.get('id') for proxy in proxies if proxy.get('id')]
+    if not ids:
+        raise ValueError("候选代理均缺少ID信息")
+    return thread_rng().sample(ids, min(k, len(ids)))
+
+def newip_batch(k):
+    """一次获取最多 k 个代理：代理列表只请求一次，详情请求并发发出；返回成功获取的代理URL列表"""
+    from concurrent.futures import ThreadPoolExecutor
     
-    print("\n🔧 ISP过滤解析结果:")
-    exclude_isps_config = config.get('exclude_isps', 'verizon,rcn')
-    print(f"  最终配置值: '{exclude_isps_config}'")
+    language = 'cn'
     
-    if exclude_isps_config.strip():
-        exclude_isps = [isp.strip().lower() for isp in exclude_isps_config.split(',') if isp.strip()]
-        print(f"  解析后的ISP列表: {exclude_isps}")
-        print(f"  ISP过滤状态: 启用")
+    try:
+        settings = load_newip_settings()
+        language = settings['language']
+        
+        proxy_ids = sample_proxy_ids(fetch_proxy_candidates(settings, keep_all=True), k)
+        log.info("🚀 批量获取 %d 个代理...", len(proxy_ids))
+        
+        # 单个详情失败不影响其他代理
+        def try_buy(proxy_id):
+            try:
+                return buy_proxy(settings, proxy_id)
+            except Exception as e:
+                log.warning("⚠️ 获取代理 %s 失败: %s", proxy_id, e)
+                return None
+        
+        with ThreadPoolExecutor(max_workers=min(len(proxy_ids), 8)) as executor:
+            proxies = [proxy for proxy in executor.map(try_buy, proxy_ids) if proxy]
+        
+        log.info("✅ 批量获取完成: %d/%d", len(proxies), len(proxy_ids))
+        return proxies
+        
+    except requests.RequestException as e:
+        handle_newip_error('request', e, language)
+    except ValueError as e:
+        handle_newip_error('config', e, language)
+    except Exception as e:
+        handle_newip_error('unknown', e, language)
+
+def get_session():
+    """获取 newip 使用的同步会话（懒加载，列表/详情/白名单请求复用连接）"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+def get_async_client():
+    """获取当前事件循环的 httpx 异步客户端（保持长连接并在支持时走 HTTP/2，事件循环变化时重建）"""
+    global _async_client, _async_client_loop
+    
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        if _async_client is not None and not _async_client.is_closed:
+            discard_async_client(_async_client, _async_client_loop)
+        _async_client = httpx.AsyncClient(
+            http2=h2 is not None,
+            timeout=10,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=8),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+def discard_async_client(client, loop):
+    """关闭被替换的异步客户端：原事件循环仍在运行时交回该循环关闭，否则在当前循环上尽力关闭"""
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(aclose_quietly(client), loop)
     else:
-        print(f"  解析后的ISP列表: []")
-        print(f"  ISP过滤状态: 禁用")
-    
-    print("="*50)
-
-def test_isp_filtering():
-    """测试ISP过滤功能"""
-    print("🧪 测试ISP过滤功能:")
-    print("="*50)
-    
-    # 模拟一些代理数据
-    test_proxies = [
-        {"id": "1", "host": "Verizon Communications Inc.", "ipaddress": "1.1.1.1"},
-        {"id": "2", "host": "T-Mobile USA, Inc.", "ipaddress": "2.2.2.2"},
-        {"id": "3", "host": "Cox Communications", "ipaddress": "3.3.3.3"},
-        {"id": "4", "host": "AT&T Services Inc.", "ipaddress": "4.4.4.4"},
-        {"id": "5", "host": "Spectrum Internet Services", "ipaddress": "5.5.5.5"},
-    ]
-    
-    config = load_config()
-    exclude_isps_config = config.get('exclude_isps', 'verizon,rcn')
-    
-    if exclude_isps_config.strip():
-        exclude_isps = [isp.strip().lower() for isp in exclude_isps_config.split(',') if isp.strip()]
+        task = asyncio.get_running_loop().create_task(aclose_quietly(client))
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+
+async def aclose_quietly(client):
+    """关闭异步客户端，忽略原事件循环已关闭等导致的错误（此时连接随对象回收释放）"""
+    try:
+        await client.aclose()
+    except Exception as e:
+        log.debug("关闭旧的异步客户端失败: %s", e)
+
+async def close_async_client():
+    """关闭当前的持久异步客户端（服务停止时调用）"""
+    global _async_client, _async_client_loop
+    
+    client, loop = _async_client, _async_client_loop
+    _async_client = _async_client_loop = None
+    if client is None or client.is_closed:
+        return
+    if loop is asyncio.get_running_loop():
+        await aclose_quietly(client)
     else:
-        exclude_isps = []
+        discard_async_client(client, loop)
+
+async def newip_async(force_refresh=False):
+    """newip 的异步版本：优先使用预取池，否则通过持久的 httpx.AsyncClient 请求接口，不阻塞事件循环"""
+    if not force_refresh:
+        proxy = take_prefetched_proxy()
+        if proxy:
+            return proxy
     
-    print(f"当前排除的ISP: {exclude_isps}")
-    print("\n代理过滤测试:")
+    language = 'cn'
     
-    for proxy in test_proxies:
-        host = proxy.get('host', '').lower()
-        proxy_id = proxy.get('id')
+    try:
+        settings = load_newip_settings()
+        language = settings['language']
+        client = get_async_client()
         
-        excluded = False
-        matched_isp = None
+        log.info("🚀 开始获取代理...")
         
-        if exclude_isps:
-            for excluded_isp in exclude_isps:
-                if excluded_isp and excluded_isp in host:
-                    excluded = True
-                    matched_isp = excluded_isp
-                    break
+        proxy_id = choose_proxy_id(await fetch_proxy_candidates_async(client, settings, force_refresh))
+        proxy = await buy_proxy_async(client, settings, proxy_id)
         
-        status = "❌ 被排除" if excluded else "✅ 通过"
-        reason = f" (匹配: '{matched_isp}')" if matched_isp else ""
+        if proxy == "error000x-13":
+            log.warning("⚠️ 检测到白名单错误，尝试添加白名单...")
+            if settings['whitelist_url']:
+                async with client.stream('GET', settings['whitelist_url'], timeout=5) as response:
+                    response.raise_for_status()
+            else:
+                log.warning(WHITELIST_MISSING_MESSAGE)
+            await asyncio.sleep(1)
+            
+            proxy_id = choose_proxy_id(await fetch_proxy_candidates_async(client, settings, force_refresh=True))
+            proxy = await buy_proxy_async(client, settings, proxy_id)
         
-        print(f"  代理{proxy_id}: {proxy['host']} -> {status}{reason}")
-    
-    print("="*50)
-def test_proxy_format():
-    """测试不同的代理格式"""
-    print("🧪 测试代理格式解析:")
-    print("="*50)
-    
-    # 模拟API响应测试
-    test_data_with_auth = {
-        "status": {"code": "1000", "message": "Success"},
-        "data": {
-            "ipaddress": "152.53.36.101",
-            "port": "1080",
-            "username": "DVS-mc9-D496",
-            "password": "n3d8toW",
-            "city": "Los Angeles",
-            "region": "California"
-        }
-    }
-    
-    test_data_no_auth = {
-        "status": {"code": "1000", "message": "Success"},
-        "data": {
-            "ipaddress": "152.53.36.101",
-            "port": "1080",
-            "username": "",
-            "password": "",
-            "city": "Los Angeles",
-            "region": "California"
-        }
-    }
-    
-    print("1. 带认证信息的代理:")
-    proxy_data = test_data_with_auth['data']
-    username = proxy_data.get('username', '').strip()
-    password = proxy_data.get('password', '').strip()
-    ip = proxy_data.get('ipaddress')
-    port = proxy_data.get('port')
+        return finish_newip(proxy)
+        
+    except httpx.HTTPError as e:
+        handle_newip_error('request', e, language)
+    except ValueError as e:
+        handle_newip_error('config', e, language)
+    except Exception as e:
+        handle_newip_error('unknown', e, language)
+
+async def fetch_proxy_candidates_async(client, settings, force_refresh=False, keep_all=None):
+    """fetch_proxy_candidates 的异步版本"""
+    if not force_refresh:
+        proxies = cached_proxy_list(settings)
+        if proxies is not None:
+            return proxies
+    
+    log.info("正在获取代理列表: %s", settings['list_url'])
+    response = await client.get(settings['list_url'])
+    response.raise_for_status()
+    
+    data = parse_json_response(response.content, "获取代理列表API响应不是有效的JSON格式")
+    return store_proxy_list(settings, filter_proxy_data(data, settings, keep_all))
+
+async def buy_proxy_async(client, settings, proxy_id):
+    """buy_proxy 的异步版本"""
+    buy_url = f"{settings['buy_url_template']}{proxy_id}"
+    log.info("获取代理详情: %s", buy_url)
     
-    if username and password:
-        result = f"socks5://{username}:{password}@{ip}:{port}"
-        print(f"   结果: {result}")
-    else:
-        result = f"socks5://{ip}:{port}"
-        print(f"   结果: {result}")
+    response = await client.get(buy_url)
+    response.raise_for_status()
     
-    print("\n2. 无认证信息的代理:")
-    proxy_data = test_data_no_auth['data']
-    username = proxy_data.get('username', '').strip()
-    password = proxy_data.get('password', '').strip()
-    ip = proxy_data.get('ipaddress')
-    port = proxy_data.get('port')
+    data = parse_json_response(response.content, "获取代理详情API响应不是有效的JSON格式")
+    return build_proxy_string(data, settings)
+
+async def newip_batch_async(k):
+    """newip_batch 的异步版本：详情请求通过共享的 httpx.AsyncClient 并发发出（HTTP/2 时复用同一连接）"""
+    language = 'cn'
     
-    if username and password:
-        result = f"socks5://{username}:{password}@{ip}:{port}"
-        print(f"   结果: {result}")
-    else:
-        result = f"socks5://{ip}:{port}"
-        print(f"   结果: {result}")
+    try:
+        settings = load_newip_settings()
+        language = settings['language']
+        client = get_async_client()
+        
+        proxy_ids = sample_proxy_ids(await fetch_proxy_candidates_async(client, settings, keep_all=True), k)
+        log.info("🚀 批量获取 %d 个代理...", len(proxy_ids))
+        
+        results = await asyncio.gather(
+            *(buy_proxy_async(client, settings, proxy_id) for proxy_id in proxy_ids),
+            return_exceptions=True
+        )
+        proxies = []
+        for proxy_id, result in zip(proxy_ids, results):
+            if isinstance(result, Exception):
+                log.warning("⚠️ 获取代理 %s 失败: %s", proxy_id, result)
+            else:
+                proxies.append(result)
+        
+        log.info("✅ 批量获取完成: %d/%d", len(proxies), len(proxy_ids))
+        return proxies
+        
+    except httpx.HTTPError as e:
+        handle_newip_error('request', e, language)
+    except ValueError as e:
+        handle_newip_error('config', e, language)
+    except Exception as e:
+        handle_newip_error('unknown', e, language)
+
+def finish_newip(proxy):
+    """输出并返回最终的SOCKS5代理URL"""
+    log.info("✅ 代理获取成功! 📋 最终代理: %s", proxy)
     
-    print("="*50)
+    return proxy
 
 # 测试函数
 if __name__ == "__main__":
@@ -466,6 +793,9 @@ if __name__ == "__main__":
     print("="*70)
     
     import sys
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # 调试/测试函数放在单独的模块中，正常导入 getip 时不会加载
+    from _getip_tests import debug_config, test_isp_filtering, test_proxy_format
     
     if len(sys.argv) > 1:
         if sys.argv[1] == "debug":
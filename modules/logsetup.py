@@ -0,0 +1,39 @@
+"""日志配置：记录先进入队列，由后台线程写到控制台和文件，磁盘写入不阻塞事件循环"""
+
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+log_listener = None  # 后台日志输出线程
+
+def setup_logging(log_file='logs/proxycat.log'):
+    """配置非阻塞日志：记录先进入队列，由后台线程写到控制台和文件"""
+    global log_listener
+
+    log_dir = os.path.dirname(log_file)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    # 队列端只保留原始消息，完整格式由下游处理器负责，避免重复前缀
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+    log_listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+    log_listener.start()
+    return log_listener
+
+def stop_logging():
+    """停止后台日志线程并刷新队列中剩余的记录"""
+    global log_listener
+    if log_listener:
+        listener, log_listener = log_listener, None
+        listener.stop()
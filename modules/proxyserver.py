@@ -1,9 +1,176 @@
 # 修复 modules/proxyserver.py 中的 AsyncProxyServer 类
 
 import asyncio
+import base64
+import contextlib
+import hmac
 import logging
+import os
+import socket
+import struct
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from .country_proxy_manager import CountryBasedProxyManager
+from .streams import take_buffered
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 连接处理热路径上的日志使用 % 惰性格式化：级别被过滤时不会拼接字符串
+log = logging.getLogger(__name__)
+
+_PORT_STRUCT = struct.Struct('>H')
+# 定长报文预编译的 Struct，一次 readexactly 读完整段再解包，省去逐字段读取
+_SOCKS4_REQUEST = struct.Struct('>BH4s')     # CMD, DSTPORT, DSTIP
+_SOCKS5_IPV4_ADDR = struct.Struct('>4sH')    # IPv4 地址 + 端口
+_SOCKS5_IPV6_ADDR = struct.Struct('>16sH')   # IPv6 地址 + 端口
+
+# 握手阶段（客户端请求解析、上游代理协商）的超时时间（秒）
+HANDSHAKE_TIMEOUT = 10
+# 隧道转发时每次读取的最大字节数
+RELAY_CHUNK_SIZE = 64 * 1024
+# 每个上游代理最多预先协商好（已完成 TCP 连接和认证、尚未发送 CONNECT）的空闲会话数量
+UPSTREAM_POOL_SIZE = 4
+# 同时在后台预建的上游会话上限，避免突发连接时成倍增加对上游的连接
+UPSTREAM_REFILL_CONCURRENCY = 2
+# 监听队列长度（默认 100 在突发连接时容易丢 SYN）
+LISTEN_BACKLOG = 4096
+# 平台支持时启用 SO_REUSEPORT，便于多个进程监听同一端口由内核分发连接
+HAS_REUSEPORT = hasattr(socket, 'SO_REUSEPORT')
+# Linux 上用 os.splice 在两个 socket 之间转发，数据经内核管道中转，不复制到用户空间
+HAS_SPLICE = hasattr(os, 'splice')
+SPLICE_FLAGS = (os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK) if HAS_SPLICE else 0
+HAS_QUICKACK = hasattr(socket, 'TCP_QUICKACK')
+# splice 中转管道的容量（默认 64KB）：调大后大流量隧道每次 splice 搬运更多数据，系统调用次数相应减少
+SPLICE_PIPE_SIZE = 256 * 1024
+HAS_SETPIPE_SZ = hasattr(fcntl, 'F_SETPIPE_SZ')
+# 切换代理前 TCP 连通性检查的超时时间（秒）
+PROXY_PROBE_TIMEOUT = 2
+# 统计信息缓存时间（秒）：Web 面板高频轮询时复用最近一次的结果
+STATS_CACHE_TTL = 0.25
+# 获取新代理前等待的合并窗口（秒）：窗口内的并发请求共用同一次 newip 调用
+NEWIP_COALESCE_WINDOW = 0.02
+# 空闲会话超过该时间（秒）未被使用则关闭，避免上游代理因超时断开后才被取用
+UPSTREAM_IDLE_TIMEOUT = 15
+
+# 各协议的成功 / 失败响应
+SOCKS5_REPLY_OK = b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+SOCKS5_REPLY_FAIL = b'\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00'
+SOCKS4_REPLY_OK = b'\x00\x5a\x00\x00\x00\x00\x00\x00'
+SOCKS4_REPLY_FAIL = b'\x00\x5b\x00\x00\x00\x00\x00\x00'
+HTTP_REPLY_OK = b'HTTP/1.1 200 Connection Established\r\n\r\n'
+HTTP_REPLY_FAIL = b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n'
+
+# newip 专用线程池：限制并发的代理获取调用，不占用事件循环的默认线程池
+_newip_executor = None
+
+def get_newip_executor():
+    """获取 newip 专用线程池（懒加载，关闭后再次使用时重建）"""
+    global _newip_executor
+    if _newip_executor is None:
+        _newip_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='newip')
+    return _newip_executor
+
+def shutdown_newip_executor():
+    """关闭 newip 专用线程池，取消尚未开始的调用"""
+    global _newip_executor
+    if _newip_executor is not None:
+        _newip_executor.shutdown(wait=False, cancel_futures=True)
+        _newip_executor = None
+
+def parse_bool(value):
+    """解析配置中的布尔值（true/1/yes/on，忽略大小写和首尾空白）"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes', 'on')
+
+# 可热更新的配置项：(配置键, 转换函数)，新配置中缺少的键保留当前值
+RELOADABLE_CONFIG = (
+    ('mode', str),
+    ('language', str),
+    ('use_getip', parse_bool),
+    ('port', int),
+    ('web_port', int),
+    ('interval', int),
+    ('display_level', int),
+    ('check_proxies', parse_bool),
+    ('proxy_username', str),
+    ('proxy_password', str),
+)
+
+def tune_socket(sock):
+    """设置隧道两端 socket：关闭 Nagle、Linux 上启用 TCP_QUICKACK（减少握手小包的延迟确认），并启用 keepalive"""
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if HAS_QUICKACK:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    except OSError:
+        pass
+
+def parse_proxy_url(proxy_url):
+    """解析 socks5://[user:pass@]host:port，返回 (host, port, username, password)"""
+    if '://' in proxy_url:
+        proxy_url = proxy_url.split('://', 1)[1]
+    
+    username = password = None
+    if '@' in proxy_url:
+        auth_part, proxy_url = proxy_url.rsplit('@', 1)
+        username, _, password = auth_part.partition(':')
+    
+    host, port = proxy_url.rsplit(':', 1)
+    return host.strip('[]'), int(port), username, password
+
+# 预解析的上游代理：host/port 供建连使用，greeting/auth 为预先编码好的 SOCKS5 协商报文（auth 为 None 表示无认证）
+ParsedProxy = namedtuple('ParsedProxy', 'url host port greeting auth')
+
+def parse_upstream_proxy(proxy_url, default_username='', default_password=''):
+    """解析上游代理URL并预编码协商报文，返回 ParsedProxy；URL 未带认证信息时使用默认用户名密码"""
+    host, port, username, password = parse_proxy_url(proxy_url)
+    if not username and default_username:
+        username, password = default_username, default_password
+    
+    auth = None
+    if username and password:
+        username_bytes = username.encode('utf-8')
+        password_bytes = password.encode('utf-8')
+        auth = (b'\x01' + bytes((len(username_bytes),)) + username_bytes
+                + bytes((len(password_bytes),)) + password_bytes)
+    greeting = b'\x05\x02\x00\x02' if auth else b'\x05\x01\x00'
+    return ParsedProxy(proxy_url, host, port, greeting, auth)
+
+def build_socks5_address(host, port):
+    """按 SOCKS5 地址格式（ATYP + 地址 + 端口）编码目标地址"""
+    try:
+        addr = b'\x01' + socket.inet_pton(socket.AF_INET, host)
+    except OSError:
+        try:
+            addr = b'\x04' + socket.inet_pton(socket.AF_INET6, host)
+        except OSError:
+            host_bytes = host.encode('idna')
+            addr = b'\x03' + bytes((len(host_bytes),)) + host_bytes
+    return addr + _PORT_STRUCT.pack(port)
+
+async def read_socks5_address(reader, atyp):
+    """按 ATYP 读取 SOCKS5 地址和端口，返回 (host, port)；地址类型不支持时返回 None"""
+    if atyp == 0x01:
+        addr, port = _SOCKS5_IPV4_ADDR.unpack(await reader.readexactly(_SOCKS5_IPV4_ADDR.size))
+        return socket.inet_ntop(socket.AF_INET, addr), port
+    if atyp == 0x04:
+        addr, port = _SOCKS5_IPV6_ADDR.unpack(await reader.readexactly(_SOCKS5_IPV6_ADDR.size))
+        return socket.inet_ntop(socket.AF_INET6, addr), port
+    if atyp != 0x03:
+        return None
+    # 域名：长度字节 + 域名 + 端口，长度读出后剩余部分一次读完
+    length = (await reader.readexactly(1))[0]
+    data = await reader.readexactly(length + 2)
+    return data[:length].decode('idna'), _PORT_STRUCT.unpack_from(data, length)[0]
 
 class AsyncProxyServer:
     """异步代理服务器类 - 修复版"""
@@ -13,20 +180,40 @@ class AsyncProxyServer:
         self.config = config
         self.mode = config.get('mode', 'cycle')
         self.language = config.get('language', 'cn')  # 添加 language 属性
-        self.use_getip = config.get('use_getip', 'False').lower() == 'true'
+        self.use_getip = parse_bool(config.get('use_getip', 'False'))
         self.port = int(config.get('port', '1080'))
         self.web_port = int(config.get('web_port', '5000'))
         
         # 代理相关属性
         self.current_proxy = None
-        self.proxy_cycle = None
-        self.proxies = []
+        # 轮换模式的代理队列：队首为当前代理，rotate(-1) 即切换到下一个
+        self.proxies = deque(self._load_proxy_file(config.get('proxy_file', 'ip.txt'))) if self.mode == 'cycle' else deque()
         self.proxy_username = config.get('proxy_username', '')
         self.proxy_password = config.get('proxy_password', '')
+        self._parsed_proxy = None  # 当前代理的 ParsedProxy 缓存，切换代理或认证信息变化时重建
+        
+        # 客户端认证（为空时不认证）
+        self.socks5_username = config.get('socks5_username', '')
+        self.socks5_password = config.get('socks5_password', '')
         
         # 服务器状态
         self.stop_server = False
         self.server = None
+        self._loop = None  # 服务器运行所在的事件循环（Web 管理线程通过它提交协程）
+        
+        # 上游会话池：代理URL -> deque[(创建时间, reader, writer)]，每个会话只用于一次 CONNECT
+        # 会话池只在有持续流量时补充：取走一个池中会话补一个；未命中时仅当上一次连接在 UPSTREAM_IDLE_TIMEOUT 内才预建
+        self._upstream_pool = {}
+        self._upstream_refilling = {}   # 代理URL -> 正在预建的会话数
+        self._upstream_last_open = {}   # 代理URL -> 上一次建立上游连接的时间
+        self._background_tasks = set()
+        
+        # 正在进行的 newip 调用，并发的获取请求等待同一个结果
+        self._newip_inflight = None
+        
+        # get_stats 结果缓存，代理切换或目标国家变化时失效
+        self._stats_cache = None
+        self._stats_ts = 0.0
         
         # 新增：国家检测管理器
         if self.mode == 'country':
@@ -39,36 +226,61 @@ class AsyncProxyServer:
         # 其他配置
         self.interval = int(config.get('interval', '300'))
         self.display_level = int(config.get('display_level', '1'))
-        self.check_proxies = config.get('check_proxies', 'False').lower() == 'true'
+        self.check_proxies = parse_bool(config.get('check_proxies', 'False'))
+    
+    @staticmethod
+    def _load_proxy_file(proxy_file):
+        """按顺序读取 config 目录下的代理列表文件中的 SOCKS5 代理（上游只按 SOCKS5 协商），文件不存在时返回空列表"""
+        path = os.path.join('config', os.path.basename(proxy_file))
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f if '://' in line]
+        except OSError:
+            return []
+        
+        proxies = [line for line in lines if line.lower().startswith(('socks5://', 'socks5h://'))]
+        if len(proxies) != len(lines):
+            log.warning("代理列表 %s 中有 %d 条非 SOCKS5 代理，轮换模式已忽略", path, len(lines) - len(proxies))
+        return proxies
+    
+    def _next_proxy(self) -> Optional[str]:
+        """轮换到下一个代理（O(1)），代理队列为空时返回 None"""
+        if not self.proxies:
+            return None
+        self.proxies.rotate(-1)
+        return self.proxies[0]
+    
+    def _demote_proxy(self, proxy: str):
+        """将不可用的代理移到队尾，轮换时最后才会再次选中"""
+        try:
+            self.proxies.remove(proxy)
+        except ValueError:
+            return
+        self.proxies.append(proxy)
     
     def _update_config_values(self, new_config):
-        """更新配置值"""
-        self.mode = new_config.get('mode', self.mode)
-        self.language = new_config.get('language', self.language)
-        self.use_getip = new_config.get('use_getip', 'False').lower() == 'true'
-        self.port = int(new_config.get('port', self.port))
-        self.web_port = int(new_config.get('web_port', self.web_port))
-        self.interval = int(new_config.get('interval', self.interval))
-        self.display_level = int(new_config.get('display_level', self.display_level))
-        self.check_proxies = new_config.get('check_proxies', 'False').lower() == 'true'
-        
-        # 更新代理认证信息
-        self.proxy_username = new_config.get('proxy_username', self.proxy_username)
-        self.proxy_password = new_config.get('proxy_password', self.proxy_password)
+        """按 RELOADABLE_CONFIG 更新配置值（新配置中缺少的键保留当前值）"""
+        for key, convert in RELOADABLE_CONFIG:
+            if key in new_config:
+                setattr(self, key, convert(new_config[key]))
+        
+        # 代理认证信息可能变化，重建预解析的代理和统计缓存
+        self._parsed_proxy = None
+        self._stats_cache = None
     
     async def start(self):
         """启动代理服务器"""
         logging.info("启动代理服务器...")
+        self._loop = asyncio.get_running_loop()
         
         # 如果是国家模式，启动国家监控
         if self.mode == 'country' and self.country_manager:
             logging.info("启动基于国家的智能代理切换模式")
             
-            # 首次获取代理
+            # 首次获取代理（在 newip 线程池中运行，不阻塞事件循环）
             if self.use_getip:
                 try:
-                    from modules.getip import newip
-                    initial_proxy = newip()
+                    initial_proxy = await self._get_new_proxy_async()
                     if initial_proxy:
                         self.current_proxy = initial_proxy
                         self.country_manager.set_current_proxy(initial_proxy)
@@ -86,12 +298,18 @@ class AsyncProxyServer:
                 )
             )
         
+        elif self.proxies and not self.use_getip and not self.current_proxy:
+            # 轮换模式：以队首代理作为初始代理
+            self.current_proxy = self.proxies[0]
+        
         # 启动 SOCKS5 代理服务器
         try:
             self.server = await asyncio.start_server(
                 self.handle_client,
                 '0.0.0.0',
-                self.port
+                self.port,
+                backlog=LISTEN_BACKLOG,
+                reuse_port=HAS_REUSEPORT or None
             )
             logging.info(f"SOCKS5 代理服务器已启动，端口: {self.port}")
             
@@ -123,67 +341,454 @@ class AsyncProxyServer:
             self.server.close()
             await self.server.wait_closed()
         
+        self._clear_upstream_pool()
+        shutdown_newip_executor()
+        
         logging.info("代理服务器已停止")
     
+    @property
+    def auth_required(self) -> bool:
+        return bool(self.socks5_username and self.socks5_password)
+    
     async def handle_client(self, reader, writer):
-        """处理客户端连接 - SOCKS5 协议处理"""
+        """处理客户端连接：纯异步解析 SOCKS5 / SOCKS4 / SOCKS4A / HTTP CONNECT 请求，经当前上游 SOCKS5 代理建立隧道"""
+        upstream_writer = None
         try:
-            # 这里应该实现完整的 SOCKS5 协议处理
-            # 为了简化，这里只是一个基本框架
+            # 启用 TCP keepalive（及时发现已断开的空闲客户端）并降低握手应答延迟
+            tune_socket(writer.get_extra_info('socket'))
             
             # 获取当前代理
             current_proxy = self.get_current_proxy()
             if not current_proxy:
-                logging.error("没有可用的代理")
-                writer.close()
-                await writer.wait_closed()
+                log.error("没有可用的代理")
                 return
             
-            # 实际的 SOCKS5 协议处理逻辑应该在这里实现
-            # 包括握手、认证、连接建立等步骤
+            # 按首字节区分协议
+            async with asyncio.timeout(HANDSHAKE_TIMEOUT):
+                version = (await reader.readexactly(1))[0]
+                if version == 0x05:
+                    request = await self._read_socks5_request(reader, writer)
+                    replies = (SOCKS5_REPLY_OK, SOCKS5_REPLY_FAIL)
+                elif version == 0x04:
+                    request = await self._read_socks4_request(reader, writer)
+                    replies = (SOCKS4_REPLY_OK, SOCKS4_REPLY_FAIL)
+                else:
+                    request = await self._read_http_connect_request(version, reader, writer)
+                    replies = (HTTP_REPLY_OK, HTTP_REPLY_FAIL)
             
-            # 这里需要根据原始代码补充完整的 SOCKS5 处理逻辑
+            if request is None:
+                return
+            target_host, target_port = request
             
+            try:
+                async with asyncio.timeout(HANDSHAKE_TIMEOUT):
+                    upstream_reader, upstream_writer = await self._open_upstream(
+                        current_proxy, target_host, target_port
+                    )
+            except (OSError, EOFError, ValueError, TimeoutError) as e:
+                log.error("连接上游代理失败 (%s:%s): %s", target_host, target_port, e)
+                writer.write(replies[1])
+                await writer.drain()
+                return
+            
+            writer.write(replies[0])
+            await writer.drain()
+            
+            await self._relay(reader, writer, upstream_reader, upstream_writer)
+            
+        except (asyncio.IncompleteReadError, TimeoutError):
+            # 客户端未完成握手就断开或超时
+            pass
         except Exception as e:
-            logging.error(f"处理客户端连接时发生错误: {e}")
+            log.error("处理客户端连接时发生错误: %s", e)
         finally:
+            # 先关闭两端再等待，等待期间被取消时另一端也已关闭；只忽略对端已断开导致的 OSError
+            stream_writers = [w for w in (upstream_writer, writer) if w is not None]
+            for stream_writer in stream_writers:
+                stream_writer.close()
+            for stream_writer in stream_writers:
+                with contextlib.suppress(OSError):
+                    await stream_writer.wait_closed()
+    
+    async def _read_socks5_request(self, reader, writer):
+        """SOCKS5：协商认证方式并读取 CONNECT 请求，返回 (host, port)；失败时已回复客户端并返回 None"""
+        methods = await reader.readexactly((await reader.readexactly(1))[0])
+        method = 0x02 if self.auth_required else 0x00
+        if method not in methods:
+            writer.write(b'\x05\xff')
+            await writer.drain()
+            return None
+        writer.write(bytes((0x05, method)))
+        
+        if method == 0x02:
+            await writer.drain()
+            # RFC 1929 用户名/密码认证
+            version = (await reader.readexactly(1))[0]
+            username = await reader.readexactly((await reader.readexactly(1))[0])
+            password = await reader.readexactly((await reader.readexactly(1))[0])
+            # 用户名和密码都做常量时间比较，避免通过响应时间逐字节猜测凭据
+            username_ok = hmac.compare_digest(username, self.socks5_username.encode('utf-8'))
+            password_ok = hmac.compare_digest(password, self.socks5_password.encode('utf-8'))
+            ok = version == 0x01 and username_ok and password_ok
+            writer.write(b'\x01\x00' if ok else b'\x01\x01')
+            if not ok:
+                await writer.drain()
+                log.warning("SOCKS5 客户端认证失败")
+                return None
+        
+        version, cmd, _, atyp = await reader.readexactly(4)
+        target = await read_socks5_address(reader, atyp)
+        if version != 0x05 or cmd != 0x01 or target is None:
+            # 只支持 CONNECT；0x07 = 不支持的命令，0x08 = 不支持的地址类型
+            code = 0x08 if target is None else 0x07
+            writer.write(bytes((0x05, code)) + SOCKS5_REPLY_FAIL[2:])
+            await writer.drain()
+            return None
+        return target
+    
+    async def _read_socks4_request(self, reader, writer):
+        """SOCKS4 / SOCKS4A：读取 CONNECT 请求，返回 (host, port)；失败时已回复客户端并返回 None"""
+        cmd, port, ip = _SOCKS4_REQUEST.unpack(await reader.readexactly(_SOCKS4_REQUEST.size))
+        await reader.readuntil(b'\x00')  # USERID
+        
+        if ip[:3] == b'\x00\x00\x00' and ip[3]:
+            # SOCKS4A：IP 为 0.0.0.x 时目标域名跟在 USERID 之后
+            host = (await reader.readuntil(b'\x00'))[:-1].decode('idna')
+        else:
+            host = socket.inet_ntop(socket.AF_INET, ip)
+        
+        # SOCKS4 无法携带密码，启用认证时拒绝
+        if cmd != 0x01 or self.auth_required:
+            writer.write(SOCKS4_REPLY_FAIL)
+            await writer.drain()
+            return None
+        return host, port
+    
+    async def _read_http_connect_request(self, first_byte, reader, writer):
+        """HTTP CONNECT：读取请求头，返回 (host, port)；失败时已回复客户端并返回 None"""
+        head = bytes((first_byte,)) + await reader.readuntil(b'\r\n\r\n')
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        parts = request_line.split()
+        
+        if len(parts) != 3 or parts[0].upper() != 'CONNECT':
+            writer.write(b'HTTP/1.1 405 Method Not Allowed\r\nAllow: CONNECT\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            return None
+        
+        if self.auth_required:
+            # 只有认证方案名 Basic 不区分大小写，Base64 凭据本身必须逐字节一致（常量时间比较）
+            expected = base64.b64encode(
+                f"{self.socks5_username}:{self.socks5_password}".encode('utf-8')
+            )
+            authorized = False
+            for name, _, value in (line.partition(':') for line in header_lines):
+                if name.strip().lower() != 'proxy-authorization':
+                    continue
+                scheme, _, token = value.strip().partition(' ')
+                if scheme.lower() == 'basic' and hmac.compare_digest(token.strip().encode('latin-1'), expected):
+                    authorized = True
+            if not authorized:
+                writer.write(
+                    b'HTTP/1.1 407 Proxy Authentication Required\r\n'
+                    b'Proxy-Authenticate: Basic realm="proxy"\r\nContent-Length: 0\r\n\r\n'
+                )
+                await writer.drain()
+                return None
+        
+        host, _, port = parts[1].rpartition(':')
+        if not host or not port.isdigit():
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            return None
+        return host.strip('[]'), int(port)
+    
+    async def _open_upstream(self, proxy_url, target_host, target_port):
+        """取得上游 SOCKS5 会话并请求连接目标，返回 (reader, writer)；失败时抛出 ConnectionError
+        
+        优先使用会话池中预先协商好的会话；池中会话已被上游断开时改用新会话重试一次
+        """
+        now = time.monotonic()
+        recent = now - self._upstream_last_open.get(proxy_url, float('-inf')) <= UPSTREAM_IDLE_TIMEOUT
+        self._upstream_last_open[proxy_url] = now
+        
+        pooled = self._take_upstream(proxy_url)
+        if pooled is not None or recent:
+            self._schedule_upstream_refill(proxy_url)
+        
+        if pooled is not None:
+            reader, writer = pooled
             try:
+                await self._upstream_connect(reader, writer, target_host, target_port)
+                return reader, writer
+            except (OSError, EOFError):
+                writer.close()
+        
+        reader, writer = await self._negotiate_upstream(proxy_url)
+        await self._upstream_connect(reader, writer, target_host, target_port)
+        return reader, writer
+    
+    async def _negotiate_upstream(self, proxy_url):
+        """连接上游 SOCKS5 代理并完成认证协商，返回 (reader, writer)；失败时抛出 ConnectionError"""
+        parsed = self._get_parsed_proxy(proxy_url)
+        
+        reader, writer = await asyncio.open_connection(parsed.host, parsed.port)
+        tune_socket(writer.get_extra_info('socket'))
+        try:
+            writer.write(parsed.greeting)
+            await writer.drain()
+            version, method = await reader.readexactly(2)
+            
+            if version != 0x05:
+                raise ConnectionError("上游代理不是 SOCKS5")
+            if method == 0x02 and parsed.auth:
+                writer.write(parsed.auth)
+                await writer.drain()
+                if (await reader.readexactly(2))[1] != 0x00:
+                    raise ConnectionError("上游代理认证失败")
+            elif method != 0x00:
+                raise ConnectionError(f"上游代理不接受的认证方式: {method}")
+        except BaseException:
+            writer.close()
+            raise
+        
+        return reader, writer
+    
+    def _get_parsed_proxy(self, proxy_url):
+        """返回代理URL对应的 ParsedProxy，当前代理只在首次使用时解析一次"""
+        parsed = self._parsed_proxy
+        if parsed is not None and parsed.url == proxy_url:
+            return parsed
+        parsed = parse_upstream_proxy(proxy_url, self.proxy_username, self.proxy_password)
+        if proxy_url == self.current_proxy:
+            self._parsed_proxy = parsed
+        return parsed
+    
+    async def _upstream_connect(self, reader, writer, target_host, target_port):
+        """在已协商的上游会话上发送 CONNECT 请求并读取响应；失败时抛出 ConnectionError"""
+        writer.write(b'\x05\x01\x00' + build_socks5_address(target_host, target_port))
+        await writer.drain()
+        
+        version, rep, _, atyp = await reader.readexactly(4)
+        if version != 0x05 or rep != 0x00:
+            writer.close()
+            raise ConnectionError(f"上游代理连接目标失败，响应码: {rep}")
+        if await read_socks5_address(reader, atyp) is None:
+            writer.close()
+            raise ConnectionError(f"上游代理响应地址类型无效: {atyp}")
+    
+    def _take_upstream(self, proxy_url):
+        """从会话池取出一个仍然可用且未超时的会话，没有时返回 None"""
+        pool = self._upstream_pool.get(proxy_url)
+        now = time.monotonic()
+        while pool:
+            created, reader, writer = pool.pop()
+            if now - created <= UPSTREAM_IDLE_TIMEOUT and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+    
+    def _schedule_upstream_refill(self, proxy_url):
+        """后台为当前代理预建一个上游会话（池满或预建任务数达到 UPSTREAM_REFILL_CONCURRENCY 时跳过）"""
+        if proxy_url != self.current_proxy or sum(self._upstream_refilling.values()) >= UPSTREAM_REFILL_CONCURRENCY:
+            return
+        pending = self._upstream_refilling.get(proxy_url, 0)
+        if len(self._upstream_pool.get(proxy_url, ())) + pending >= UPSTREAM_POOL_SIZE:
+            return
+        self._upstream_refilling[proxy_url] = pending + 1
+        task = asyncio.create_task(self._refill_upstream_pool(proxy_url))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _refill_upstream_pool(self, proxy_url):
+        try:
+            async with asyncio.timeout(HANDSHAKE_TIMEOUT):
+                reader, writer = await self._negotiate_upstream(proxy_url)
+            if proxy_url != self.current_proxy:
+                writer.close()
+                return
+            self._upstream_pool.setdefault(proxy_url, deque()).append((time.monotonic(), reader, writer))
+        except (OSError, EOFError, ValueError, TimeoutError) as e:
+            log.debug("预建上游会话失败: %s", e)
+        finally:
+            remaining = self._upstream_refilling.pop(proxy_url, 1) - 1
+            if remaining > 0:
+                self._upstream_refilling[proxy_url] = remaining
+    
+    def _clear_upstream_pool(self):
+        """关闭并清空所有空闲的上游会话（切换代理或停止服务器时调用）"""
+        for pool in self._upstream_pool.values():
+            for _, _, writer in pool:
                 writer.close()
-                await writer.wait_closed()
-            except:
+        self._upstream_pool.clear()
+        self._upstream_last_open.clear()
+    
+    async def _relay(self, client_reader, client_writer, upstream_reader, upstream_writer):
+        """双向转发数据直到两个方向都结束（Linux 上走 splice 零拷贝，其他平台走 StreamReader/StreamWriter）"""
+        if HAS_SPLICE and client_writer.get_extra_info('socket') and upstream_writer.get_extra_info('socket'):
+            await self._relay_splice(client_reader, client_writer, upstream_reader, upstream_writer)
+        else:
+            await self._relay_streams(client_reader, client_writer, upstream_reader, upstream_writer)
+    
+    async def _relay_streams(self, client_reader, client_writer, upstream_reader, upstream_writer):
+        # TaskGroup：一个方向异常退出时取消另一个方向，不会留下仍在读写的孤立任务
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._pipe(client_reader, upstream_writer))
+            tg.create_task(self._pipe(upstream_reader, client_writer))
+    
+    async def _pipe(self, reader, writer):
+        """单向转发：读到 EOF 后半关闭对端写方向；出错时关闭对端"""
+        try:
+            while data := await reader.read(RELAY_CHUNK_SIZE):
+                writer.write(data)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (OSError, RuntimeError):
+            writer.close()
+    
+    async def _relay_splice(self, client_reader, client_writer, upstream_reader, upstream_writer):
+        """握手完成后暂停两端传输的读取，直接在 socket 之间 splice 转发"""
+        # 暂停读取后到达的数据留在内核 socket 中由 splice 转发；
+        # 握手阶段 StreamReader 已缓冲的数据先转发给对端
+        for reader, writer, peer in ((client_reader, client_writer, upstream_writer),
+                                     (upstream_reader, upstream_writer, client_writer)):
+            leftover = await take_buffered(reader, writer.transport)
+            if leftover:
+                peer.write(leftover)
+        await client_writer.drain()
+        await upstream_writer.drain()
+        
+        # 传输占用的 fd 不能再注册到事件循环，使用 dup 出的 fd 等待就绪
+        client_fd = os.dup(client_writer.get_extra_info('socket').fileno())
+        upstream_fd = os.dup(upstream_writer.get_extra_info('socket').fileno())
+        try:
+            # 两个方向都结束（或一方异常、另一方已被取消）后才关闭 dup 出的 fd
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self._splice_pipe(client_fd, upstream_fd, upstream_writer))
+                tg.create_task(self._splice_pipe(upstream_fd, client_fd, client_writer))
+        finally:
+            os.close(client_fd)
+            os.close(upstream_fd)
+    
+    async def _splice_pipe(self, src_fd, dst_fd, dst_writer):
+        """单向 splice 转发：src socket -> 管道 -> dst socket；读到 EOF 后半关闭对端写方向，出错时关闭对端"""
+        loop = asyncio.get_running_loop()
+        pipe_r, pipe_w = os.pipe()
+        chunk_size = RELAY_CHUNK_SIZE
+        if HAS_SETPIPE_SZ:
+            try:
+                # 超过 pipe-max-size 或用户管道配额时保持默认容量
+                chunk_size = fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, SPLICE_PIPE_SIZE)
+            except OSError:
                 pass
+        pending = 0
+        try:
+            while True:
+                if not pending:
+                    try:
+                        pending = os.splice(src_fd, pipe_w, chunk_size, flags=SPLICE_FLAGS)
+                    except BlockingIOError:
+                        await self._wait_fd(loop.add_reader, loop.remove_reader, src_fd)
+                        continue
+                    if not pending:
+                        break
+                try:
+                    pending -= os.splice(pipe_r, dst_fd, pending, flags=SPLICE_FLAGS)
+                except BlockingIOError:
+                    await self._wait_fd(loop.add_writer, loop.remove_writer, dst_fd)
+            if dst_writer.can_write_eof():
+                dst_writer.write_eof()
+        except OSError:
+            dst_writer.close()
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+    
+    @staticmethod
+    async def _wait_fd(add, remove, fd):
+        """等待 fd 可读/可写"""
+        future = asyncio.get_running_loop().create_future()
+        add(fd, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            remove(fd)
     
     async def _get_new_proxy_async(self) -> Optional[str]:
-        """异步获取新代理"""
-        if self.use_getip:
-            try:
-                # 在线程池中运行同步的 newip 函数
-                loop = asyncio.get_event_loop()
-                from modules.getip import newip
-                proxy = await loop.run_in_executor(None, newip)
-                return proxy
-            except Exception as e:
-                logging.error(f"获取新代理失败: {e}")
-                return None
-        return None
+        """异步获取新代理（监控、手动切换等同时发起的请求合并为一次 newip 调用，结果共享给所有等待者）"""
+        if not self.use_getip:
+            return None
+        
+        if self._newip_inflight is None:
+            self._newip_inflight = asyncio.ensure_future(self._fetch_new_proxy())
+            self._newip_inflight.add_done_callback(self._clear_newip_inflight)
+        
+        # shield：单个等待者被取消时不影响其他等待者共享的获取任务
+        return await asyncio.shield(self._newip_inflight)
+    
+    def _clear_newip_inflight(self, future):
+        if self._newip_inflight is future:
+            self._newip_inflight = None
     
-    async def _switch_proxy_async(self, new_proxy: str):
-        """异步切换代理"""
+    async def _fetch_new_proxy(self) -> Optional[str]:
+        """在合并窗口结束后，在 newip 专用线程池中运行同步的 newip 函数"""
+        await asyncio.sleep(NEWIP_COALESCE_WINDOW)
+        try:
+            loop = asyncio.get_running_loop()
+            from modules.getip import newip
+            return await loop.run_in_executor(get_newip_executor(), newip)
+        except Exception as e:
+            logging.error(f"获取新代理失败: {e}")
+            return None
+    
+    async def _probe_proxy(self, parsed: ParsedProxy) -> bool:
+        """在 PROXY_PROBE_TIMEOUT 内能与代理建立 TCP 连接时返回 True"""
+        try:
+            async with asyncio.timeout(PROXY_PROBE_TIMEOUT):
+                _, writer = await asyncio.open_connection(parsed.host, parsed.port)
+        except (OSError, TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+    
+    async def _switch_proxy_async(self, new_proxy: str) -> bool:
+        """异步切换代理：新代理通过 TCP 连通性检查后才替换当前代理，返回是否已切换"""
+        try:
+            parsed = parse_upstream_proxy(new_proxy, self.proxy_username, self.proxy_password)
+        except ValueError as e:
+            log.error("代理地址格式无效: %s (%s)", new_proxy, e)
+            return False
+        if not await self._probe_proxy(parsed):
+            log.warning("新代理连通性检查失败，保留当前代理: %s", new_proxy)
+            return False
+        
         old_proxy = self.current_proxy
         self.current_proxy = new_proxy
+        self._parsed_proxy = parsed
+        self._stats_cache = None
+        self._clear_upstream_pool()
         
         # 更新国家管理器的当前代理
         if self.country_manager:
             self.country_manager.set_current_proxy(new_proxy)
         
-        logging.info(f"代理已切换: {old_proxy} -> {new_proxy}")
+        log.info("代理已切换: %s -> %s", old_proxy, new_proxy)
+        return True
     
     def get_current_proxy(self) -> Optional[str]:
         """获取当前代理"""
         return self.current_proxy
     
     def get_stats(self) -> dict:
-        """获取统计信息"""
+        """获取统计信息（STATS_CACHE_TTL 内直接返回缓存的结果，调用方不应修改返回的字典）"""
+        now = time.monotonic()
+        if self._stats_cache is not None and now - self._stats_ts < STATS_CACHE_TTL:
+            return self._stats_cache
+        
         stats = {
             'mode': self.mode,
             'current_proxy': self.current_proxy,
@@ -197,6 +802,8 @@ class AsyncProxyServer:
         if self.country_manager:
             stats.update(self.country_manager.get_stats())
         
+        self._stats_cache = stats
+        self._stats_ts = now
         return stats
     
     async def manual_switch_proxy(self) -> bool:
@@ -205,8 +812,7 @@ class AsyncProxyServer:
             try:
                 new_proxy = await self._get_new_proxy_async()
                 if new_proxy:
-                    await self._switch_proxy_async(new_proxy)
-                    return True
+                    return await self._switch_proxy_async(new_proxy)
                 return False
             except Exception as e:
                 logging.error(f"手动切换代理失败: {e}")
@@ -214,12 +820,13 @@ class AsyncProxyServer:
         else:
             # 对于其他模式的手动切换逻辑
             try:
-                if self.use_getip:
-                    new_proxy = await self._get_new_proxy_async()
-                    if new_proxy:
-                        self.current_proxy = new_proxy
+                if self.use_getip or self.proxies:
+                    new_proxy = await self._get_new_proxy_async() if self.use_getip else self._next_proxy()
+                    if new_proxy and await self._switch_proxy_async(new_proxy):
                         logging.info(f"手动切换代理成功: {new_proxy}")
                         return True
+                    if new_proxy and not self.use_getip:
+                        self._demote_proxy(new_proxy)
                 return False
             except Exception as e:
                 logging.error(f"手动切换代理失败: {e}")
@@ -229,6 +836,7 @@ class AsyncProxyServer:
         """设置目标国家"""
         if self.country_manager:
             self.country_manager.target_country = country_code.upper()
+            self._stats_cache = None
             logging.info(f"目标国家已设置为: {country_code}")
     
     def get_target_country(self) -> str:
@@ -242,30 +850,62 @@ class AsyncProxyServer:
 import asyncio
 import logging
 import signal
-import sys
 from modules.proxyserver import AsyncProxyServer
 from modules.modules import load_config, print_banner, get_message
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 import threading
+import os
+import re
+from modules.logsetup import setup_logging, stop_logging
+from modules.eventloop import install_event_loop_policy
+
+try:
+    import orjson  # 可选依赖：更快的 JSON 序列化
+except ImportError:
+    orjson = None
+
+try:
+    # 可选依赖：在代理服务器的事件循环上提供 Web 管理接口，关闭时等待进行中的请求完成
+    from asgiref.wsgi import WsgiToAsgi
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config as HypercornConfig
+except ImportError:
+    hypercorn_serve = None
+
+# 关闭时等待 Web 管理接口处理完进行中请求的最长时间（秒）
+WEB_SHUTDOWN_TIMEOUT = 5
 
 # 全局变量
 proxy_server = None
 app = Flask(__name__)
 
-def signal_handler(signum, frame):
-    """信号处理器"""
-    print('\n正在关闭服务器...')
-    if proxy_server:
-        # 停止服务器
+# 目标国家代码：2 位 ASCII 字母（ISO 3166-1 alpha-2）
+COUNTRY_CODE_RE = re.compile(r'[A-Za-z]{2}')
+
+# Web 管理接口等待协程结果的超时时间（秒）
+WEB_COROUTINE_TIMEOUT = 30
+
+def run_on_server_loop(coro, timeout=WEB_COROUTINE_TIMEOUT):
+    """在代理服务器的事件循环中执行协程并等待结果（供 Flask 线程调用，不再为每个请求创建事件循环）"""
+    loop = proxy_server._loop if proxy_server else None
+    if loop is None or not loop.is_running():
+        coro.close()
+        raise RuntimeError('代理服务器事件循环未运行')
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=timeout)
+
+def json_response(payload, status=200):
+    """返回 JSON 响应：安装了 orjson 时用它序列化，否则退回 Flask 的 jsonify"""
+    if orjson is not None:
+        return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+    return jsonify(payload), status
+
+def install_shutdown_handlers(loop, shutdown_event):
+    """在运行中的事件循环上注册 SIGINT/SIGTERM，收到信号时设置 shutdown_event（Windows 不支持时退回 KeyboardInterrupt）"""
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(proxy_server.stop())
-            else:
-                loop.run_until_complete(proxy_server.stop())
-        except:
+            loop.add_signal_handler(sig, shutdown_event.set)
+        except (NotImplementedError, RuntimeError):
             pass
-    sys.exit(0)
 
 # Web API 路由
 @app.route('/')
@@ -279,129 +919,143 @@ def get_proxy_stats():
     try:
         if proxy_server:
             stats = proxy_server.get_stats()
-            return jsonify({
+            return json_response({
                 'success': True,
                 'data': stats
             })
         else:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': 'Proxy server not initialized'
-            }), 500
+            }, 500)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/proxy/switch', methods=['POST'])
 def manual_switch():
     """手动切换代理"""
     try:
         if not proxy_server:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': 'Proxy server not initialized'
-            }), 500
+            }, 500)
             
-        # 在新的事件循环中运行异步操作
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            success = loop.run_until_complete(proxy_server.manual_switch_proxy())
-            return jsonify({
-                'success': success,
-                'message': '代理切换成功' if success else '代理切换失败'
-            })
-        finally:
-            loop.close()
+        # 在代理服务器的事件循环中执行，共享其代理状态和上游会话池
+        success = run_on_server_loop(proxy_server.manual_switch_proxy())
+        return json_response({
+            'success': success,
+            'message': '代理切换成功' if success else '代理切换失败'
+        })
+    except TimeoutError:
+        return json_response({
+            'success': False,
+            'error': '代理切换超时'
+        }, 504)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/api/proxy/country', methods=['GET', 'POST'])
 def manage_target_country():
     """获取或设置目标国家"""
     if not proxy_server:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': 'Proxy server not initialized'
-        }), 500
+        }, 500)
         
     if request.method == 'GET':
         try:
             country = proxy_server.get_target_country()
-            return jsonify({
+            return json_response({
                 'success': True,
                 'target_country': country
             })
         except Exception as e:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': str(e)
-            }), 500
+            }, 500)
     
     elif request.method == 'POST':
         try:
-            data = request.get_json()
-            country = data.get('country', '').strip().upper()
+            data = request.get_json(silent=True) or {}
+            country = str(data.get('country') or '').strip()
             
-            if len(country) != 2:
-                return jsonify({
+            if not COUNTRY_CODE_RE.fullmatch(country):
+                return json_response({
                     'success': False,
                     'error': '国家代码必须是2位字母'
-                }), 400
+                }, 400)
             
+            country = country.upper()
             proxy_server.set_target_country(country)
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': f'目标国家已设置为: {country}'
             })
         except Exception as e:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': str(e)
-            }), 500
+            }, 500)
 
 @app.route('/api/proxy/blacklist/update', methods=['POST'])
 def update_blacklist():
     """手动更新IP黑名单"""
     try:
         if not proxy_server or not proxy_server.country_manager:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'error': '当前模式不支持IP黑名单功能'
-            }), 400
+            }, 400)
             
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            success = loop.run_until_complete(proxy_server.country_manager.update_ip_blacklist())
-            return jsonify({
-                'success': success,
-                'message': 'IP黑名单更新成功' if success else 'IP黑名单更新失败'
-            })
-        finally:
-            loop.close()
+        success = run_on_server_loop(proxy_server.country_manager.update_ip_blacklist())
+        return json_response({
+            'success': success,
+            'message': 'IP黑名单更新成功' if success else 'IP黑名单更新失败'
+        })
+    except TimeoutError:
+        return json_response({
+            'success': False,
+            'error': 'IP黑名单更新超时'
+        }, 504)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
-def run_flask_app():
+def run_flask_app(port=5000):
     """在单独线程中运行Flask应用"""
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+
+def start_web_app(port, shutdown_event):
+    """启动 Web 管理接口：安装了 hypercorn 时作为当前事件循环上的任务运行并返回该任务（shutdown_event 触发后优雅关闭），
+    否则退回在守护线程中运行 Flask 并返回 None"""
+    if hypercorn_serve is None:
+        threading.Thread(target=run_flask_app, args=(port,), daemon=True).start()
+        return None
+    
+    web_config = HypercornConfig()
+    web_config.bind = [f'0.0.0.0:{port}']
+    web_config.graceful_timeout = WEB_SHUTDOWN_TIMEOUT
+    return asyncio.create_task(hypercorn_serve(WsgiToAsgi(app), web_config, shutdown_trigger=shutdown_event.wait))
 
 async def main():
     """主函数"""
     global proxy_server
     
-    # 设置信号处理
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    # 设置信号处理：信号只设置事件，由 main 在同一事件循环中完成关闭
+    shutdown_event = asyncio.Event()
+    install_shutdown_handlers(asyncio.get_running_loop(), shutdown_event)
+    web_task = None
     
     try:
         # 加载配置
@@ -413,9 +1067,8 @@ async def main():
         # 创建代理服务器实例
         proxy_server = AsyncProxyServer(config)
         
-        # 启动Flask应用（在单独线程中）
-        flask_thread = threading.Thread(target=run_flask_app, daemon=True)
-        flask_thread.start()
+        # 启动Web管理接口（优先在当前事件循环上运行，未安装 hypercorn 时在单独线程中运行）
+        web_task = start_web_app(proxy_server.web_port, shutdown_event)
         
         # 显示Web面板URL
         web_url = f"http://localhost:{proxy_server.web_port}"
@@ -430,8 +1083,20 @@ async def main():
             logging.info(f"⏱️  检测间隔: {check_interval}秒")
             logging.info(f"🛡️  IP黑名单: {'启用' if config.get('enable_ip_blacklist', True) else '禁用'}")
         
-        # 启动代理服务器
-        await proxy_server.start()
+        # 启动代理服务器，直到服务器退出或收到关闭信号
+        server_task = asyncio.create_task(proxy_server.start())
+        shutdown_task = asyncio.create_task(shutdown_event.wait())
+        await asyncio.wait({server_task, shutdown_task}, return_when=asyncio.FIRST_COMPLETED)
+        
+        if shutdown_task.done():
+            logging.info("接收到中断信号，正在关闭服务器...")
+            server_task.cancel()
+        else:
+            shutdown_task.cancel()
+        try:
+            await server_task
+        except asyncio.CancelledError:
+            pass
             
     except KeyboardInterrupt:
         logging.info("接收到中断信号，正在关闭服务器...")
@@ -440,22 +1105,28 @@ async def main():
         import traceback
         traceback.print_exc()
     finally:
+        # 通知 Web 管理接口停止接受新请求，等待进行中的请求完成
+        shutdown_event.set()
+        if web_task is not None:
+            try:
+                async with asyncio.timeout(WEB_SHUTDOWN_TIMEOUT + 1):
+                    await web_task
+            except (asyncio.CancelledError, TimeoutError):
+                web_task.cancel()
+            except Exception as e:
+                logging.error(f"Web 管理接口运行错误: {e}")
         if proxy_server:
             await proxy_server.stop()
 
 if __name__ == '__main__':
-    # 设置日志
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('proxycat.log', encoding='utf-8')
-        ]
-    )
+    # 设置日志（队列 + 后台监听线程，磁盘写入不阻塞事件循环）
+    setup_logging('proxycat.log')
     
     # 运行主函数
+    install_event_loop_policy()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         print("程序已退出")
+    finally:
+        stop_logging()
@@ -0,0 +1,24 @@
+"""StreamReader 交接：握手结束、切换到底层转发前取出 StreamReader 已缓冲的数据"""
+
+import asyncio
+
+async def take_buffered(reader, transport, chunk_size=64 * 1024):
+    """暂停传输的读取并取出 StreamReader 已缓冲的全部数据，返回时传输保持暂停
+
+    只使用公开的 read()：缓冲区非空或已到 EOF 时 read() 不挂起，直接返回数据；
+    缓冲区读空后 read() 需要等待新数据，由 asyncio.timeout(0) 在下一轮事件循环取消并结束。
+    read() 取走数据时会恢复此前因缓冲超限而暂停的传输，所以每次读取前都重新暂停，
+    保证等待时传输处于暂停状态，不会有数据在交接后才进入 StreamReader
+    """
+    chunks = []
+    while True:
+        transport.pause_reading()
+        try:
+            async with asyncio.timeout(0):
+                chunk = await reader.read(chunk_size)
+        except TimeoutError:
+            break
+        if not chunk:
+            break  # EOF
+        chunks.append(chunk)
+    return b''.join(chunks)